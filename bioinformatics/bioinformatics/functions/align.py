@@ -1,5 +1,6 @@
-from typing import Optional
-from Bio import AlignIO, Seq
+from typing import Optional, Union
+import numpy as np
+from Bio import AlignIO
 from bioinformatics.functions.file_utils import (
     replace_parent_directory,
     suffix_parser,
@@ -8,25 +9,42 @@ from bioinformatics.functions.file_utils import (
     replace_suffix,
 )
 from bioinformatics.models.alignment import (
+    Alignment,
     AlignmentOutputFormat,
     AlignmentSoftware,
 )
-from bioinformatics.functions.file_utils import generate_process
-from bioinformatics.functions.ingest import read_seq_file, write_seq_file
-
-
-def pad_alignment(in_file: str, ambiguious_char: Optional[str] = "-") -> None:
-    suffix = suffix_parser(in_file)
-    records = list(read_seq_file(in_file))
-    maxlen = max(len(record.seq) for record in records)
-    for record in records:
-        if len(record.seq) != maxlen:
-            sequence = str(record.seq).ljust(maxlen, ambiguious_char)
-            record.seq = Seq.Seq(sequence)
+from bioinformatics.functions.cache import cached_process
+from bioinformatics.functions.ingest import read_alignment
+
+
+def get_padded_file(in_file: str) -> str:
     output_file = inject_parent_directory(in_file, "padded")
-    output_file = replace_suffix(output_file, suffix)
+    return replace_suffix(output_file, suffix_parser(in_file))
+
+
+def pad_matrix(aln: Alignment, ambiguious_char: Optional[str] = "-") -> Alignment:
+    matrix = aln.matrix.copy()
+    matrix[np.arange(aln.width) >= aln.lengths[:, None]] = ord(ambiguious_char)
+    return Alignment(matrix, aln.ids, aln.descriptions, None, aln.path)
+
+
+def pad_alignment(
+    in_file: Union[str, Alignment],
+    ambiguious_char: Optional[str] = "-",
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
+    # write=False returns the padded alignment (its path set to the file it
+    # would have been written to, or None without a source path) for the next
+    # in-memory stage
+    aln = read_alignment(in_file)
+    output_file = get_padded_file(aln.path) if aln.path else None
+    padded = pad_matrix(aln, ambiguious_char)
+    padded.path = output_file
+    if not write:
+        return padded
     create_parent_directory(output_file)
-    write_seq_file(records, output_file, suffix)
+    padded.write(output_file, suffix_parser(aln.path))
+    return output_file
 
 
 def align_pairwise(
@@ -62,23 +80,31 @@ def convert_format(
     AlignIO.write(alignments, open(out_file, "w"), out_file_format)
 
 
+def get_alignment_file(
+    in_file: str, aligner: AlignmentSoftware, output_format: AlignmentOutputFormat
+) -> str:
+    out_file = replace_parent_directory(
+        in_file, "/".join(in_file.split("/")[1:3]), f"output/alignments/{aligner.name}"
+    )
+    return out_file.replace(suffix_parser(out_file), output_format.name)
+
+
 def perform_alignment(
     in_file: str,
     aligner: AlignmentSoftware,
     output_format: AlignmentOutputFormat,
     iterations: Optional[int] = None,
     stdout: bool = False,
-) -> None:
+    threads: Optional[int] = None,
+    cache: Optional[bool] = True,
+) -> str:
     # in_file = 'bioinformatics/input/fasta/LEP1/L1.fa'
     # aligner = AlignmentSoftware("clustal_omega")
     # output_format = AlignmentOutputFormat("fasta")
     # iterations = 5
 
+    out_file = get_alignment_file(in_file, aligner, output_format)
     output_format = output_format.name
-    out_file = replace_parent_directory(
-        in_file, "/".join(in_file.split("/")[1:3]), f"output/alignments/{aligner.name}"
-    )
-    out_file = out_file.replace(suffix_parser(out_file), output_format)
     create_parent_directory(out_file)
     if not iterations:
         iterations = 1
@@ -101,6 +127,8 @@ def perform_alignment(
                 str(iterations),
             ]
         )
+        if threads:
+            cmd.extend(["--threads", str(threads)])
     elif aligner.name == "muscle5":
         src = "bioinformatics/src/align/muscle5.1.linux_intel64"
         in_param = "-align"
@@ -109,6 +137,8 @@ def perform_alignment(
         cmd.extend(
             [src, in_param, in_file, out_param, out_file, iters_param, str(iterations)]
         )
+        if threads:
+            cmd.extend(["-threads", str(threads)])
     elif aligner.name == "muscle3":
         src = "bioinformatics/src/align/muscle3.8.31_i86linux64"
         in_param = "-in"
@@ -119,4 +149,5 @@ def perform_alignment(
         )
     else:
         raise Exception("Alignment software choice not understood.")
-    generate_process(cmd, stdout)
+    cached_process(cmd, [in_file], [out_file], stdout=stdout, cache=cache)
+    return out_file
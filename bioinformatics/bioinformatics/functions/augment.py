@@ -1,9 +1,375 @@
-# def create_aa_alignment()  # will require a function to calculate reading frame
-# def create_nt12_all_alignment()  # the data with only first and second codon positions included
-# def create_nt12_degen_alignment()  # the data which codes for only non-synonymous changes
-# def backtranslate() # convert AA to DNA (e.g., see tool, "Backtranseq" and "Backtranambig" @ https://www.ebi.ac.uk/Tools/st/)
+from itertools import product
+from typing import Optional, Union
+import numpy as np
+from Bio.Data.IUPACData import ambiguous_dna_values
+from bioinformatics.functions.file_utils import (
+    create_parent_directory,
+    inject_parent_directory,
+    inject_prefix_suffix,
+)
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.functions.orf import (
+    dna_code,
+    stop_codon_code,
+    unresolvable_codon_code,
+)
+from bioinformatics.functions.partition import (
+    get_charset_columns,
+    get_codon_position_view,
+    read_partition_file,
+)
+from bioinformatics.models.alignment import Alignment
 
+# in_file = 'bioinformatics/output/supermatrix/LEP1.phy'
+# partition_file = 'bioinformatics/output/supermatrix/LEP1_partitions.nex'
+popcount_table = np.array([bin(x).count("1") for x in range(256)], dtype=np.int64)
 
-# remove_taxon_by_site_completeness()
-# remove_taxon_by_gene_completeness()
-# remove_site_by_taxon_completeness()
+
+def get_missing_mask(
+    aln: Alignment, missing_chars: list[str] = ["-", "?", "N", "X"]
+) -> np.ndarray:
+    # one bit per cell, set where the cell is missing data (either case) or lies
+    # beyond the row's true length; rows are packed 8 sites to a byte
+    chars = "".join(missing_chars)
+    missing = np.zeros(256, dtype=bool)
+    missing[np.frombuffer((chars.upper() + chars.lower()).encode(), np.uint8)] = True
+    mask = missing[aln.matrix]
+    mask |= np.arange(aln.width) >= aln.lengths[:, None]
+    return np.packbits(mask, axis=1)
+
+
+def get_taxon_completeness(packed: np.ndarray, sites: np.ndarray) -> np.ndarray:
+    # fraction of the selected sites each taxon has data for, from row popcounts
+    # of the mask restricted to those sites
+    site_bits = np.packbits(sites)
+    missing = popcount_table[packed & site_bits].sum(axis=1)
+    return 1 - missing / max(int(sites.sum()), 1)
+
+
+def get_site_completeness(
+    packed: np.ndarray, taxa: np.ndarray, width: int, chunk_rows: int = 1024
+) -> np.ndarray:
+    # fraction of the selected taxa with data at each site; rows are unpacked a
+    # chunk at a time so the full boolean matrix is never held in memory
+    missing = np.zeros(width, dtype=np.int64)
+    for start in range(0, len(packed), chunk_rows):
+        rows = packed[start : start + chunk_rows][taxa[start : start + chunk_rows]]
+        missing += np.unpackbits(rows, axis=1, count=width).sum(axis=0, dtype=np.int64)
+    return 1 - missing / max(int(taxa.sum()), 1)
+
+
+def get_gene_completeness(
+    packed: np.ndarray,
+    charsets: list[np.ndarray],
+    sites: np.ndarray,
+    min_sites: Optional[int] = 1,
+) -> np.ndarray:
+    # fraction of loci (charsets with a selected site) in which each taxon has at
+    # least min_sites sites of data
+    present = np.zeros(len(packed), dtype=np.int64)
+    loci = 0
+    for columns in charsets:
+        charset_sites = np.zeros(len(sites), dtype=bool)
+        charset_sites[columns] = True
+        charset_sites &= sites
+        if not charset_sites.any():
+            continue
+        missing = popcount_table[packed & np.packbits(charset_sites)].sum(axis=1)
+        present += charset_sites.sum() - missing >= min_sites
+        loci += 1
+    return present / max(loci, 1)
+
+
+def get_completeness_file(in_file: str, filter_name: str) -> str:
+    return inject_prefix_suffix(
+        inject_parent_directory(in_file, "completeness"), "", f"_{filter_name}"
+    )
+
+
+def subset_alignment(
+    aln: Alignment, taxa: np.ndarray, sites: np.ndarray, path: Optional[str] = None
+) -> Alignment:
+    return Alignment(
+        aln.matrix[taxa][:, sites],
+        aln.ids[taxa],
+        aln.descriptions[taxa],
+        np.minimum(aln.lengths[taxa], int(sites.sum())),
+        path,
+    )
+
+
+def finish_filter(
+    aln: Alignment, taxa: np.ndarray, sites: np.ndarray, filter_name: str, write: bool
+) -> Union[str, Alignment]:
+    path = get_completeness_file(aln.path, filter_name) if aln.path else None
+    filtered = subset_alignment(aln, taxa, sites, path)
+    if not write:
+        return filtered
+    create_parent_directory(filtered.path)
+    filtered.write(filtered.path)
+    return filtered.path
+
+
+def remove_taxon_by_site_completeness(
+    in_file: Union[str, Alignment],
+    min_completeness: float,
+    missing_chars: list[str] = ["-", "?", "N", "X"],
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
+    # drops taxa with data at fewer than min_completeness of the sites
+    aln = read_alignment(in_file)
+    packed = get_missing_mask(aln, missing_chars)
+    sites = np.ones(aln.width, dtype=bool)
+    taxa = get_taxon_completeness(packed, sites) >= min_completeness
+    return finish_filter(aln, taxa, sites, "taxon_site_complete", write)
+
+
+def remove_taxon_by_gene_completeness(
+    in_file: Union[str, Alignment],
+    partition_file: str,
+    min_completeness: float,
+    min_sites: Optional[int] = 1,
+    missing_chars: list[str] = ["-", "?", "N", "X"],
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
+    # drops taxa with data (at least min_sites sites) in fewer than
+    # min_completeness of the loci listed in partition_file
+    aln = read_alignment(in_file)
+    packed = get_missing_mask(aln, missing_chars)
+    charsets = [get_charset_columns(x) for _, x in read_partition_file(partition_file)]
+    sites = np.ones(aln.width, dtype=bool)
+    taxa = get_gene_completeness(packed, charsets, sites, min_sites) >= min_completeness
+    return finish_filter(aln, taxa, sites, "taxon_gene_complete", write)
+
+
+def remove_site_by_taxon_completeness(
+    in_file: Union[str, Alignment],
+    min_completeness: float,
+    missing_chars: list[str] = ["-", "?", "N", "X"],
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
+    # drops sites where fewer than min_completeness of the taxa have data
+    aln = read_alignment(in_file)
+    packed = get_missing_mask(aln, missing_chars)
+    taxa = np.ones(len(aln), dtype=bool)
+    sites = get_site_completeness(packed, taxa, aln.width) >= min_completeness
+    return finish_filter(aln, taxa, sites, "site_taxon_complete", write)
+
+
+def filter_by_completeness(
+    in_file: Union[str, Alignment],
+    min_taxon_completeness: float,
+    min_site_completeness: float,
+    iterative: Optional[bool] = True,
+    max_rounds: Optional[int] = 100,
+    missing_chars: list[str] = ["-", "?", "N", "X"],
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
+    # alternates taxon and site filtering, each judged only over what the other
+    # kept, until neither removes anything (or a single round if not iterative).
+    # the mask is packed once and every round only re-counts bits
+    aln = read_alignment(in_file)
+    packed = get_missing_mask(aln, missing_chars)
+    taxa = np.ones(len(aln), dtype=bool)
+    sites = np.ones(aln.width, dtype=bool)
+    for _ in range(max_rounds if iterative else 1):
+        new_taxa = taxa & (
+            get_taxon_completeness(packed, sites) >= min_taxon_completeness
+        )
+        new_sites = sites & (
+            get_site_completeness(packed, new_taxa, aln.width) >= min_site_completeness
+        )
+        converged = (new_taxa == taxa).all() and (new_sites == sites).all()
+        taxa, sites = new_taxa, new_sites
+        if converged:
+            break
+    return finish_filter(aln, taxa, sites, "complete", write)
+
+
+# lookup tables for the codon-level alignments below. Every table is built once
+# from dna_code; codons are indexed by base codes over the full IUPAC alphabet,
+# as orf.codon_table is over the bases it uses
+# in_file = 'bioinformatics/output/alignments/muscle3/LEP1/ORF1/ORF1_L1.fasta'
+upper_table = np.arange(256, dtype=np.uint8)
+upper_table[ord("a") : ord("z") + 1] -= 32
+iupac_codes = {
+    frozenset(bases): code
+    for code, bases in ambiguous_dna_values.items()
+    if code != "X"
+}
+sense_codons = {"".join(x): dna_code["".join(x)] for x in product("ACGT", repeat=3)}
+
+
+codon_alphabet = "-" + "".join(x for x in ambiguous_dna_values if x != "X")
+base_codes = np.zeros(256, dtype=np.uint8)
+for code, base in enumerate(codon_alphabet, start=1):
+    base_codes[ord(base)] = code
+codon_radix = len(codon_alphabet) + 1
+ambiguous_residues = {
+    frozenset("DN"): "B",
+    frozenset("EQ"): "Z",
+    frozenset("IL"): "J",
+}
+
+
+def get_codon_index(codons: np.ndarray) -> np.ndarray:
+    codes = base_codes[upper_table[codons]].astype(np.intp)
+    return (
+        codes[..., 0] * codon_radix**2 + codes[..., 1] * codon_radix + codes[..., 2]
+    )
+
+
+def get_iupac_codon(codons: list[str]) -> str:
+    # per-position IUPAC union of a set of codons
+    return "".join(iupac_codes[frozenset(x)] for x in zip(*codons))
+
+
+def get_synonymous_groups(amino_acid: str) -> list[list[str]]:
+    # codons of one amino acid split into groups linked by single-base
+    # synonymous changes (Ser: TCN and AGY stay apart, as in Degen1)
+    groups = []
+    for codon in [x for x, y in sense_codons.items() if y == amino_acid]:
+        linked = [
+            x
+            for x in groups
+            if any(sum(a != b for a, b in zip(codon, y)) == 1 for y in x)
+        ]
+        groups = [x for x in groups if x not in linked]
+        groups.append(sum(linked, [codon]))
+    return groups
+
+
+def build_translation_table() -> np.ndarray:
+    # codon index -> residue. An ambiguous codon is translated whenever every
+    # codon it expands to codes for the same residue (GCY -> A, MGN -> R), or
+    # for one of the ambiguous residue pairs (RAY -> B); orf.codon_table only
+    # lists the ambiguous codons needed for ORF scoring
+    table = np.full(codon_radix**3, ord(unresolvable_codon_code), dtype=np.uint8)
+    for codon in product(codon_alphabet, repeat=3):
+        if codon == ("-", "-", "-"):
+            residues = {"-"}
+        elif all(x in ambiguous_dna_values for x in codon):
+            expanded = product(*(ambiguous_dna_values[x] for x in codon))
+            residues = {sense_codons["".join(x)] for x in expanded}
+        else:
+            continue
+        residue = ambiguous_residues.get(frozenset(residues))
+        if len(residues) == 1:
+            residue = residues.pop()
+        if residue:
+            index = get_codon_index(np.frombuffer("".join(codon).encode(), np.uint8))
+            table[index] = ord(residue)
+    return table
+
+
+def build_degen_table() -> tuple[np.ndarray, np.ndarray]:
+    # unambiguous codon index -> degenerate codon; the mask marks indexes with
+    # one. Stop codons are left as they are: their group (TRR) would also
+    # cover TGG (Trp)
+    table = np.zeros((codon_radix**3, 3), dtype=np.uint8)
+    resolved = np.zeros(codon_radix**3, dtype=bool)
+    for amino_acid in set(sense_codons.values()) - {stop_codon_code}:
+        for group in get_synonymous_groups(amino_acid):
+            degenerate = np.frombuffer(get_iupac_codon(group).encode(), np.uint8)
+            index = get_codon_index(
+                np.frombuffer("".join(group).encode(), np.uint8).reshape(-1, 3)
+            )
+            table[index] = degenerate
+            resolved[index] = True
+    return (table, resolved)
+
+
+def build_backtranslation_table() -> np.ndarray:
+    # residue -> the IUPAC codon covering every codon of that amino acid, as
+    # Backtranambig does; gaps and missing data keep their character
+    table = np.full((256, 3), ord("N"), dtype=np.uint8)
+    for amino_acid in set(sense_codons.values()):
+        codon = get_iupac_codon([x for x, y in sense_codons.items() if y == amino_acid])
+        for residue in {amino_acid, amino_acid.lower()}:
+            table[ord(residue)] = np.frombuffer(codon.encode(), np.uint8)
+    for char in "-?":
+        table[ord(char)] = ord(char)
+    return table
+
+
+translation_table = build_translation_table()
+degen_table, degen_resolved = build_degen_table()
+backtranslation_table = build_backtranslation_table()
+
+
+def get_augmented_file(in_file: str, name: str) -> str:
+    return inject_parent_directory(in_file, name)
+
+
+def finish_augmented(
+    aln: Alignment, matrix: np.ndarray, lengths: np.ndarray, name: str, write: bool
+) -> Union[str, Alignment]:
+    augmented = Alignment(
+        matrix,
+        aln.ids,
+        aln.descriptions,
+        lengths,
+        get_augmented_file(aln.path, name) if aln.path else None,
+    )
+    if not write:
+        return augmented
+    create_parent_directory(augmented.path)
+    augmented.write(augmented.path)
+    return augmented.path
+
+
+def create_aa_alignment(
+    in_file: Union[str, Alignment], write: Optional[bool] = True
+) -> Union[str, Alignment]:
+    # in_file must already be in ORF1 (see fix_dna_alignment): codons start at
+    # the first column, so no reading frame has to be found here
+    aln = read_alignment(in_file)
+    codons = get_codon_position_view(aln.matrix, "nt123")
+    matrix = translation_table[get_codon_index(codons)]
+    return finish_augmented(aln, matrix, -(-aln.lengths // 3), "aa", write)
+
+
+def create_nt12_all_alignment(
+    in_file: Union[str, Alignment], write: Optional[bool] = True
+) -> Union[str, Alignment]:
+    aln = read_alignment(in_file)
+    matrix = get_codon_position_view(aln.matrix, "nt12").reshape(len(aln), -1)
+    return finish_augmented(aln, matrix, -(-aln.lengths // 3) * 2, "nt12", write)
+
+
+def create_nt12_degen_alignment(
+    in_file: Union[str, Alignment], write: Optional[bool] = True
+) -> Union[str, Alignment]:
+    # every unambiguous codon is replaced by the IUPAC codon of its synonymous
+    # group, so only non-synonymous change remains; codons holding gaps or
+    # ambiguity codes are kept as they are
+    aln = read_alignment(in_file)
+    codons = get_codon_position_view(aln.matrix, "nt123")
+    index = get_codon_index(codons)
+    degen = np.where(degen_resolved[index][..., None], degen_table[index], codons)
+    matrix = degen[:, :, :2].reshape(len(aln), -1)
+    return finish_augmented(aln, matrix, -(-aln.lengths // 3) * 2, "nt12_degen", write)
+
+
+def backtranslate(
+    in_file: Union[str, Alignment], write: Optional[bool] = True
+) -> Union[str, Alignment]:
+    aln = read_alignment(in_file)
+    matrix = backtranslation_table[aln.matrix].reshape(len(aln), -1)
+    return finish_augmented(aln, matrix, aln.lengths * 3, "backtranslated", write)
+
+
+augmented_alignments = {
+    "aa": create_aa_alignment,
+    "nt12": create_nt12_all_alignment,
+    "nt12_degen": create_nt12_degen_alignment,
+}
+
+
+def create_augmented_alignments(
+    in_file: Union[str, Alignment],
+    alignments: Optional[list[str]] = ["aa", "nt12", "nt12_degen"],
+) -> dict[str, str]:
+    # the locus is parsed once and every requested alignment built from it
+    aln = read_alignment(in_file)
+    return {x: augmented_alignments[x](aln) for x in alignments}
@@ -1,12 +1,21 @@
 import csv
 import os
 import re
+import sqlite3
+import time
+import zlib
 from turtle import st
 from typing import Optional
 import numpy as np
 
 from bioinformatics.models.phylogeny import PhyloSoftware
-from bioinformatics.functions.phylogeny import infer_phylogeny, generate_random_tree
+from bioinformatics.functions.phylogeny import (
+    infer_phylogeny,
+    generate_random_tree,
+    estimate_phylogeny_resources,
+    load_resource_history,
+)
+from bioinformatics.functions.parallel import run_budgeted, run_parallel
 from bioinformatics.functions.file_utils import (
     get_platform_info,
     create_parent_directory,
@@ -21,7 +30,11 @@ def is_partition_file(filename: str, ext_list: list[str] = ["part"]) -> Optional
         return match.group()
 
 
-def benchmark_state(file: str, all_files: list[str]) -> str:
+benchmark_registry_file = "bioinformatics/output/benchmark/benchmark_registry.sqlite"
+benchmark_states = ["queued", "started", "checkpointed", "completed"]
+
+
+def benchmark_state(file: str, all_files: set[str]) -> str:
     if file + ".bionj" in all_files:
         return "completed"
     elif file + ".ckp.gz" in all_files:
@@ -32,6 +45,123 @@ def benchmark_state(file: str, all_files: list[str]) -> str:
         return "queued"
 
 
+def open_benchmark_registry(
+    registry_file: Optional[str] = benchmark_registry_file,
+) -> sqlite3.Connection:
+    # jobs holds the last known state of every alignment; folders holds the
+    # mtime each folder had when it was last listed
+    create_parent_directory(registry_file)
+    conn = sqlite3.connect(registry_file)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            alignment TEXT PRIMARY KEY,
+            root TEXT NOT NULL,
+            folder TEXT NOT NULL,
+            suffix TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (root, suffix, state);
+        CREATE INDEX IF NOT EXISTS jobs_folder ON jobs (folder);
+        CREATE TABLE IF NOT EXISTS folders (
+            folder TEXT PRIMARY KEY,
+            root TEXT NOT NULL,
+            parent TEXT,
+            mtime_ns INTEGER NOT NULL
+        );
+        """
+    )
+    return conn
+
+
+def sync_folder(
+    conn: sqlite3.Connection, folder: str, root: str, alignment_type: str
+) -> list[str]:
+    # relists one folder and rewrites the states of its alignments; returns the
+    # subfolders found. Hidden entries (e.g. AliSim's .partial_ staging
+    # directories) are skipped
+    files = set()
+    subfolders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subfolders.append(entry.path)
+            else:
+                files.add(entry.name)
+    now = time.time()
+    rows = [
+        (f"{folder}/{x}", root, folder, alignment_type, benchmark_state(x, files), now)
+        for x in files
+        if x.endswith(f".{alignment_type}")
+    ]
+    conn.execute(
+        "DELETE FROM jobs WHERE folder = ? AND suffix = ?", (folder, alignment_type)
+    )
+    conn.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return subfolders
+
+
+def sync_benchmark_registry(
+    conn: sqlite3.Connection,
+    alignment_type: Optional[str] = "phy",
+    alignment_sets: Optional[str] = "bioinformatics/input/benchmark/sim_data",
+) -> None:
+    # a folder is only relisted when its mtime changed (a file was created,
+    # renamed or removed in it); unchanged folders cost one stat and their known
+    # subfolders are followed from the registry
+    root = alignment_sets.rstrip("/")
+    known = {
+        folder: (mtime_ns, parent)
+        for folder, mtime_ns, parent in conn.execute(
+            "SELECT folder, mtime_ns, parent FROM folders WHERE root = ?", (root,)
+        )
+    }
+    children = {}
+    for folder, (_, parent) in known.items():
+        children.setdefault(parent, []).append(folder)
+    seen = set()
+    pending = [(root, None)]
+    while pending:
+        folder, parent = pending.pop()
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        seen.add(folder)
+        if folder in known and known[folder][0] == mtime_ns:
+            subfolders = children.get(folder, [])
+        else:
+            subfolders = sync_folder(conn, folder, root, alignment_type)
+            conn.execute(
+                "INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)",
+                (folder, root, parent, mtime_ns),
+            )
+        pending.extend((x, folder) for x in subfolders)
+    for folder in set(known) - seen:
+        conn.execute("DELETE FROM folders WHERE folder = ?", (folder,))
+        conn.execute("DELETE FROM jobs WHERE folder = ?", (folder,))
+    conn.commit()
+
+
+def get_benchmark_jobs(
+    conn: sqlite3.Connection,
+    states: list[str],
+    alignment_type: Optional[str] = "phy",
+    alignment_sets: Optional[str] = "bioinformatics/input/benchmark/sim_data",
+) -> list[tuple[str, str]]:
+    # (alignment path, state) pairs, answered from the index
+    query = (
+        "SELECT alignment, state FROM jobs WHERE root = ? AND suffix = ? "
+        f"AND state IN ({', '.join('?' * len(states))}) ORDER BY alignment"
+    )
+    return conn.execute(
+        query, (alignment_sets.rstrip("/"), alignment_type, *states)
+    ).fetchall()
+
+
 def interrupted_benchmark_cleanup(file: str) -> None:
     os.remove(file + ".log")
     os.remove(file + ".model.gz")
@@ -40,65 +170,101 @@ def interrupted_benchmark_cleanup(file: str) -> None:
 def status_tally(
     alignment_type: Optional[str] = "phy",
     alignment_sets: Optional[str] = "bioinformatics/input/benchmark/sim_data",
+    registry_file: Optional[str] = benchmark_registry_file,
 ) -> None:
-    completed = 0
-    queued = 0
-    started = 0
-    other = 0
-    total = 0
-    todo = []
-    for root, dirs, files in os.walk(alignment_sets):
-        for filename in [x for x in files if re.search(rf"\.{alignment_type}$", x)]:
-            state = benchmark_state(filename, files)
-            if state == "completed":
-                completed += 1
-            elif state == "queued":
-                queued += 1
-                todo.append(filename)
-            elif state == "started":
-                started += 1
-                todo.append(filename)
-            else:
-                other += 1
-            total += 1
+    conn = open_benchmark_registry(registry_file)
+    sync_benchmark_registry(conn, alignment_type, alignment_sets)
+    counts = dict(
+        conn.execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE root = ? AND suffix = ? "
+            "GROUP BY state",
+            (alignment_sets.rstrip("/"), alignment_type),
+        ).fetchall()
+    )
+    todo = [
+        os.path.basename(x)
+        for x, _ in get_benchmark_jobs(
+            conn, ["queued", "started"], alignment_type, alignment_sets
+        )
+    ]
+    conn.close()
+    total = sum(counts.values())
     return {
-        "completed": completed,
-        "queued": queued,
-        "started": started,
+        "completed": counts.get("completed", 0),
+        "queued": counts.get("queued", 0),
+        "started": counts.get("started", 0),
         "total": total,
-        "remaining": total - completed,
+        "remaining": total - counts.get("completed", 0),
         "todo": todo,
     }
 
 
+def run_benchmark_phylogeny(
+    job: tuple[str, Optional[str]],
+    builder: PhyloSoftware,
+    stdout: Optional[bool] = False,
+    threads: Optional[int] = None,
+    memory_mb: Optional[int] = None,
+) -> None:
+    alignment_path, partition_file = job
+    infer_phylogeny(
+        alignment_path,
+        builder,
+        partition_file,
+        stdout,
+        threads=threads,
+        memory_mb=memory_mb,
+    )
+
+
 def benchmark_phylogeny(
     builder: PhyloSoftware,
     alignment_type: Optional[str] = "phy",
     alignment_sets: Optional[str] = "bioinformatics/input/benchmark/sim_data",
     use_partition: Optional[bool] = False,
     stdout: Optional[bool] = False,
+    cores: Optional[int] = None,
+    memory_mb: Optional[int] = None,
+    results_file: Optional[
+        str
+    ] = "bioinformatics/output/benchmark/benchmark_results.csv",
+    registry_file: Optional[str] = benchmark_registry_file,
 ) -> None:
+    # runs are sized from their alignment and the RAM of earlier runs in
+    # results_file, then packed concurrently within cores and memory_mb
+    # (defaults: every core and all physical memory)
     platform_info = get_platform_info()
-    for root, dirs, files in os.walk(alignment_sets):
-        for filename in [
-            x
-            for x in files
-            if re.search(rf"\.{alignment_type}$", x) and not is_partition_file(x)
-        ]:
-            state = benchmark_state(filename, files)
-            if state in ["queued", "started", "checkpointed"]:
-                alignment_path = root + "/" + filename
-                if state in ["started"]:
-                    interrupted_benchmark_cleanup(alignment_path)
-                partition_file = None
-                if use_partition:
-                    part_file = re.sub(
-                        r"(\..*?)$", is_partition_file(filename), filename
-                    )
-                    if part_file in files:
-                        partition_file = part_file
-                # print(alignment_path)
-                infer_phylogeny(alignment_path, builder, partition_file, stdout)
+    conn = open_benchmark_registry(registry_file)
+    sync_benchmark_registry(conn, alignment_type, alignment_sets)
+    jobs = []
+    for alignment_path, state in get_benchmark_jobs(
+        conn, ["queued", "started", "checkpointed"], alignment_type, alignment_sets
+    ):
+        filename = os.path.basename(alignment_path)
+        if is_partition_file(filename):
+            continue
+        if state in ["started"]:
+            interrupted_benchmark_cleanup(alignment_path)
+        partition_file = None
+        if use_partition:
+            part_file = re.sub(r"(\..*?)$", is_partition_file(filename), filename)
+            if os.path.exists(os.path.join(os.path.dirname(alignment_path), part_file)):
+                partition_file = part_file
+        # print(alignment_path)
+        jobs.append((alignment_path, partition_file))
+    history = load_resource_history(results_file)
+    demands = [estimate_phylogeny_resources(x[0], history) for x in jobs]
+    run_budgeted(
+        run_benchmark_phylogeny,
+        jobs,
+        demands,
+        cores=cores,
+        memory_mb=memory_mb,
+        builder=builder,
+        stdout=stdout,
+    )
+    sync_benchmark_registry(conn, alignment_type, alignment_sets)
+    conn.close()
 
 
 def input_check(range_data: list[float, float, float]) -> bool:
@@ -122,6 +288,30 @@ def input_check(range_data: list[float, float, float]) -> bool:
     return True
 
 
+def get_cell_seed(seed: int, cell: tuple) -> int:
+    # stable across runs and independent of grid order or size; kept within the
+    # positive int range IQ-TREE accepts for --seed
+    return zlib.crc32(f"{seed}:{cell}".encode()) % 2**31
+
+
+def generate_benchmark_cell(
+    cell: tuple[str, int, int, float, float, int],
+    output_folder: Optional[str] = "bioinformatics/input/benchmark/sim_data",
+    stdout: Optional[bool] = False,
+) -> str:
+    process, ntaxa, nsites, birth_rate, death_rate, seed = cell
+    return generate_random_tree(
+        ntaxa=ntaxa,
+        nsites=nsites,
+        process=process,
+        output_folder=output_folder,
+        birth_rate=birth_rate,
+        death_rate=death_rate,
+        stdout=stdout,
+        seed=seed,
+    )
+
+
 def generate_benchmark_data(
     ntaxa_range: list[int, int, int],
     nsites_range: list[int, int, int],
@@ -130,7 +320,12 @@ def generate_benchmark_data(
     birth_rate_range: Optional[list[float, float, float]] = [0.1, 0.1, 0.0],
     death_rate_range: Optional[list[float, float, float]] = [0.05, 0.05, 0.0],
     stdout: Optional[bool] = False,
+    seed: Optional[int] = 0,
+    jobs: Optional[int] = 1,
 ) -> None:
+    # every grid cell gets its own seed (kept in its file names) and cells whose
+    # alignment already exists are skipped, so an interrupted sweep resumes
+    # where it stopped and reruns reproduce the same data
     # fix input ranges to get proper end point (zero indexing problem)
     ntaxa_range, nsites_range, birth_rate_range, death_rate_range = list(
         map(
@@ -149,44 +344,32 @@ def generate_benchmark_data(
         input_check,
         [ntaxa_range, nsites_range, birth_rate_range, death_rate_range],
     )
-    if all(list(verify_inputs)):  # verify passed data
-        for process in processes:
-            for ntaxa in [
-                x for x in np.arange(ntaxa_range[0], ntaxa_range[1], ntaxa_range[2])
-            ]:
-                for nsites in [
-                    y
-                    for y in np.arange(
-                        nsites_range[0], nsites_range[1], nsites_range[2]
-                    )
-                ]:
-                    for birth_rate in [
-                        z
-                        for z in np.arange(
-                            birth_rate_range[0],
-                            birth_rate_range[1],
-                            birth_rate_range[2],
-                        )
-                    ]:
-                        for death_rate in [
-                            t
-                            for t in np.arange(
-                                death_rate_range[0],
-                                death_rate_range[1],
-                                death_rate_range[2],
-                            )
-                        ]:
-                            generate_random_tree(
-                                ntaxa=ntaxa,
-                                nsites=nsites,
-                                process=process,
-                                output_folder=output_folder,
-                                birth_rate=birth_rate,
-                                death_rate=death_rate,
-                                stdout=stdout,
-                            )
-    else:
+    if not all(list(verify_inputs)):  # verify passed data
         raise Exception(ValueError)
+    cells = {}
+    for process in processes:
+        for ntaxa in np.arange(*ntaxa_range):
+            for nsites in np.arange(*nsites_range):
+                for birth_rate in np.arange(*birth_rate_range):
+                    for death_rate in np.arange(*death_rate_range):
+                        if process != "bd":  # rates do not apply
+                            birth_rate = birth_rate_range[0]
+                            death_rate = death_rate_range[0]
+                        cell = (
+                            process,
+                            int(ntaxa),
+                            int(nsites),
+                            float(birth_rate),
+                            float(death_rate),
+                        )
+                        cells[cell] = get_cell_seed(seed, cell)
+    run_parallel(
+        generate_benchmark_cell,
+        [cell + (cell_seed,) for cell, cell_seed in cells.items()],
+        jobs=jobs,
+        output_folder=output_folder,
+        stdout=stdout,
+    )
 
 
 def extract_text_matches(result: dict[str, re.Match]) -> dict[str, str]:
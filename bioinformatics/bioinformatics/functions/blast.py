@@ -1,12 +1,57 @@
+import html
 import re
-import subprocess
-from typing import List, Optional
+from typing import Iterator, List, Optional
+from xml.etree import ElementTree
+from bioinformatics.functions.cache import cached_process
+from bioinformatics.models.blast import BlastHit, BlastOutputFormat
 from bioinformatics.functions.file_utils import (
     replace_parent_directory,
     create_parent_directory,
+    generate_process,
 )
 
 
+# columns requested for tabular output so hits carry the subject sequence
+blast_tabular_fields = [
+    "qseqid",
+    "sseqid",
+    "pident",
+    "length",
+    "mismatch",
+    "gapopen",
+    "qstart",
+    "qend",
+    "sstart",
+    "send",
+    "evalue",
+    "bitscore",
+    "qlen",
+    "sseq",
+]
+
+# outfmt 7 "# Fields:" names
+blast_commented_fields = {
+    "query id": "qseqid",
+    "query acc.ver": "qseqid",
+    "query acc.": "qseqid",
+    "subject id": "sseqid",
+    "subject acc.ver": "sseqid",
+    "subject acc.": "sseqid",
+    "% identity": "pident",
+    "alignment length": "length",
+    "mismatches": "mismatch",
+    "gap opens": "gapopen",
+    "q. start": "qstart",
+    "q. end": "qend",
+    "s. start": "sstart",
+    "s. end": "send",
+    "evalue": "evalue",
+    "bit score": "bitscore",
+    "query length": "qlen",
+    "subject seq": "sseq",
+}
+
+
 def get_blast_program(translated: bool = False) -> str:
     if not translated:
         blast_program = "bioinformatics/src/blast/ncbi-blast-2.13.0+/bin/blastn"
@@ -15,7 +60,7 @@ def get_blast_program(translated: bool = False) -> str:
     return blast_program
 
 
-def apply_dcmegablast(cmd: subprocess) -> subprocess:
+def apply_dcmegablast(cmd: List[str]) -> List[str]:
     cmd.extend(["-task", "dc-megablast"])
     return cmd
 
@@ -24,6 +69,7 @@ def create_blast_db(
     consensus_seq_set: str,
     blast_db_out: Optional[str] = None,
     data_type: Optional[str] = "nucl",
+    cache: Optional[bool] = True,
 ) -> None:
     if not blast_db_out:
         consensus_location = "/".join(consensus_seq_set.split("/")[1:-1])
@@ -46,8 +92,8 @@ def create_blast_db(
         "-title",
         blast_db_out.split("/")[-1],
     ]
-    subprocess.run(
-        cmd,
+    cached_process(
+        cmd, [consensus_seq_set], out_prefix=blast_db_out, stdout=True, cache=cache
     )
 
 
@@ -76,9 +122,7 @@ def reciprocal_blastn(
     ]
     if megablast:
         cmd = apply_dcmegablast(cmd)
-    subprocess.run(
-        cmd,
-    )
+    generate_process(cmd, stdout=True, input_files=[query_db])
 
 
 def pair_all_blast_dbs(blast_dbs: List[str]) -> List[tuple[str]]:
@@ -92,9 +136,14 @@ def single_fasta_blast(
     blast_result_out: str,
     translated: Optional[bool] = False,
     dcmegablast: Optional[bool] = False,
+    threads: Optional[int] = None,
+    output_format: Optional[BlastOutputFormat] = BlastOutputFormat.xml,
 ):
     blast_program = get_blast_program(translated)
     create_parent_directory(blast_result_out)
+    outfmt = output_format.value
+    if output_format != BlastOutputFormat.xml:
+        outfmt = " ".join([outfmt] + blast_tabular_fields)
     cmd = [
         blast_program,
         "-db",
@@ -104,37 +153,287 @@ def single_fasta_blast(
         "-out",
         blast_result_out,
         "-outfmt",
-        "5",
+        outfmt,
     ]
     if dcmegablast:
         cmd = apply_dcmegablast(cmd)
-    subprocess.run(
-        cmd,
+    if threads:
+        cmd.extend(["-num_threads", str(threads)])
+    generate_process(cmd, stdout=True, input_files=[query])
+
+
+def concatenate_queries(queries: dict[str, str], combined_query: str) -> None:
+    # every record of a locus is relabelled with the locus tag so hits can be
+    # split back out by query definition
+    create_parent_directory(combined_query)
+    with open(combined_query, "w") as f_out:
+        for query_tag, query in queries.items():
+            with open(query) as f:
+                for line in f:
+                    if line.startswith(">"):
+                        f_out.write(f">{query_tag}\n")
+                    elif line.strip():
+                        f_out.write(line if line.endswith("\n") else line + "\n")
+
+
+def split_blast_result(blast_result: str, output_folder: str) -> dict[str, str]:
+    # splits a multi-query XML (-outfmt 5) result into one file per query,
+    # holding a single <Iteration> block in memory at a time
+    create_parent_directory(output_folder + "/")
+    header = []
+    block = []
+    in_iterations = False
+    split_files = {}
+    opened = set()
+    footer = "  </BlastOutput_iterations>\n</BlastOutput>\n"
+    with open(blast_result) as f:
+        for line in f:
+            if not in_iterations:
+                header.append(line)
+                if "<BlastOutput_iterations>" in line:
+                    in_iterations = True
+                continue
+            if "<Iteration>" in line:
+                block = [line]
+            elif block:
+                block.append(line)
+                if "</Iteration>" in line:
+                    query_def = re.search(
+                        r"<Iteration_query-def>(.*?)</Iteration_query-def>",
+                        "".join(block),
+                    )
+                    query_tag = html.unescape(query_def.group(1)) if query_def else ""
+                    out_file = f"{output_folder}/{query_tag}"
+                    mode = "a" if out_file in opened else "w"
+                    with open(out_file, mode) as f_out:
+                        if mode == "w":
+                            f_out.writelines(header)
+                        f_out.writelines(block)
+                    split_files[query_tag] = out_file
+                    opened.add(out_file)
+                    block = []
+    for out_file in opened:
+        with open(out_file, "a") as f_out:
+            f_out.write(footer)
+    return split_files
+
+
+def multi_fasta_blast(
+    queries: dict[str, str],
+    ref_db: str,
+    blast_result_out: str,
+    translated: Optional[bool] = False,
+    dcmegablast: Optional[bool] = False,
+    threads: Optional[int] = None,
+) -> dict[str, str]:
+    # one BLAST run (and one database load) for all queries; results are split
+    # into blast_result_out/<query_tag> files matching single_fasta_blast output
+    combined_query = blast_result_out + ".batch.fasta"
+    combined_result = blast_result_out + ".batch.xml"
+    concatenate_queries(queries, combined_query)
+    single_fasta_blast(
+        query=combined_query,
+        ref_db=ref_db,
+        blast_result_out=combined_result,
+        translated=translated,
+        dcmegablast=dcmegablast,
+        threads=threads,
+    )
+    return split_blast_result(combined_result, blast_result_out)
+
+
+def get_blast_output_format(blast_hit_file: str) -> BlastOutputFormat:
+    with open(blast_hit_file) as f:
+        for line in f:
+            if line.strip():
+                if line.lstrip().startswith("<"):
+                    return BlastOutputFormat.xml
+                elif line.startswith("#"):
+                    return BlastOutputFormat.tabular_commented
+                return BlastOutputFormat.tabular
+    return BlastOutputFormat.xml
+
+
+def iter_blast_xml(blast_hit_file: str) -> Iterator[tuple[str, list[BlastHit]]]:
+    # yields (database, hits) once per query; each <Iteration> is cleared after
+    # it is read so memory is bounded by a single query's hits
+    db = ""
+    context = ElementTree.iterparse(blast_hit_file, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end":
+            continue
+        if elem.tag == "BlastOutput_db":
+            db = elem.text or ""
+        elif elem.tag == "Iteration":
+            query_id = elem.findtext("Iteration_query-def", "")
+            query_length = elem.findtext("Iteration_query-len")
+            query_length = int(query_length) if query_length else None
+            hits = []
+            for hit in elem.iter("Hit"):
+                subject_id = hit.findtext("Hit_id", "")
+                for hsp in hit.iter("Hsp"):
+                    alignment_length = int(hsp.findtext("Hsp_align-len", "0"))
+                    identity = int(hsp.findtext("Hsp_identity", "0"))
+                    hits.append(
+                        BlastHit(
+                            query_id=query_id,
+                            subject_id=subject_id,
+                            percent_identity=(
+                                100 * identity / alignment_length
+                                if alignment_length
+                                else 0.0
+                            ),
+                            alignment_length=alignment_length,
+                            query_start=int(hsp.findtext("Hsp_query-from", "0")),
+                            query_end=int(hsp.findtext("Hsp_query-to", "0")),
+                            subject_start=int(hsp.findtext("Hsp_hit-from", "0")),
+                            subject_end=int(hsp.findtext("Hsp_hit-to", "0")),
+                            evalue=float(hsp.findtext("Hsp_evalue", "inf")),
+                            bitscore=float(hsp.findtext("Hsp_bit-score", "0")),
+                            query_length=query_length,
+                            subject_sequence=hsp.findtext("Hsp_hseq", ""),
+                        )
+                    )
+            elem.clear()
+            root.clear()
+            yield (db, hits)
+
+
+def parse_blast_tabular_row(values: list[str], fields: list[str]) -> BlastHit:
+    row = dict(zip(fields, values))
+    return BlastHit(
+        query_id=row["qseqid"],
+        subject_id=row["sseqid"],
+        percent_identity=float(row["pident"]),
+        alignment_length=int(row["length"]),
+        query_start=int(row["qstart"]),
+        query_end=int(row["qend"]),
+        subject_start=int(row["sstart"]),
+        subject_end=int(row["send"]),
+        evalue=float(row["evalue"]),
+        bitscore=float(row["bitscore"]),
+        query_length=int(row["qlen"]) if row.get("qlen") else None,
+        subject_sequence=row.get("sseq", ""),
     )
 
 
-def parse_blast_result(blast_hit_file: str) -> tuple[str, str]:
+def iter_blast_tabular(
+    blast_hit_file: str, fields: Optional[list[str]] = None
+) -> Iterator[tuple[str, list[BlastHit]]]:
+    # -outfmt 6/7 rows are grouped by query; BLAST writes each query's rows
+    # contiguously so only the current query's hits are held
+    fields = fields or blast_tabular_fields
+    query_id = None
+    hits = []
     with open(blast_hit_file) as f:
-        hit_data = f.read()
+        for line in f:
+            if line.startswith("# Fields:"):
+                fields = [
+                    blast_commented_fields.get(x.strip(), x.strip())
+                    for x in line[len("# Fields:") :].split(",")
+                ]
+                continue
+            if line.startswith("#") or not line.strip():
+                continue
+            hit = parse_blast_tabular_row(line.rstrip("\n").split("\t"), fields)
+            if hit.query_id != query_id and hits:
+                yield ("", hits)
+                hits = []
+            query_id = hit.query_id
+            hits.append(hit)
+    if hits:
+        yield ("", hits)
+
+
+def rank_blast_hits(
+    hits: list[BlastHit],
+    max_evalue: Optional[float] = None,
+    min_bitscore: Optional[float] = None,
+    min_coverage: Optional[float] = None,
+    top_n: Optional[int] = None,
+) -> list[BlastHit]:
+    if max_evalue is not None:
+        hits = [x for x in hits if x.evalue <= max_evalue]
+    if min_bitscore is not None:
+        hits = [x for x in hits if x.bitscore >= min_bitscore]
+    if min_coverage is not None:
+        hits = [
+            x
+            for x in hits
+            if x.query_coverage is not None and x.query_coverage >= min_coverage
+        ]
+    hits = sorted(hits, key=lambda x: (-x.bitscore, x.evalue))
+    if top_n is not None:
+        hits = hits[:top_n]
+    return hits
+
+
+def iter_blast_hits(
+    blast_hit_file: str,
+    max_evalue: Optional[float] = None,
+    min_bitscore: Optional[float] = None,
+    min_coverage: Optional[float] = None,
+    top_n: Optional[int] = None,
+    output_format: Optional[BlastOutputFormat] = None,
+) -> Iterator[tuple[str, BlastHit]]:
+    # yields (database, hit) lazily, best hits first within each query
+    if not output_format:
+        output_format = get_blast_output_format(blast_hit_file)
+    if output_format == BlastOutputFormat.xml:
+        queries = iter_blast_xml(blast_hit_file)
+    else:
+        queries = iter_blast_tabular(blast_hit_file)
+    for db, hits in queries:
+        for hit in rank_blast_hits(hits, max_evalue, min_bitscore, min_coverage, top_n):
+            yield (db, hit)
+
+
+def get_blast_db_label(db: str) -> str:
+    lab = db.split("/")[-1].replace("genome_", "").capitalize()
+    return lab + "_BLAST_genome_extracted"
+
+
+def parse_blast_result(
+    blast_hit_file: str,
+    max_evalue: Optional[float] = None,
+    min_bitscore: Optional[float] = None,
+    min_coverage: Optional[float] = None,
+    ref_db: Optional[str] = None,
+) -> tuple[str, str]:
+    # ref_db labels tabular results, which do not record the database
     seq = ""
     lab = ""
-    first_hit_scoring_pair = re.search(r"<Hsp_hseq>(.*?)</Hsp_hseq>", hit_data)
-    if first_hit_scoring_pair:
-        seq = first_hit_scoring_pair.group(1)
-    label_data = re.search(r"<BlastOutput_db>(.*?)</BlastOutput_db>", hit_data)
-    if label_data:
-        lab = label_data.group(1).split("/")[-1].replace("genome_", "").capitalize()
-        lab = lab + "_BLAST_genome_extracted"
+    best_hit = next(
+        iter_blast_hits(
+            blast_hit_file, max_evalue, min_bitscore, min_coverage, top_n=1
+        ),
+        None,
+    )
+    if best_hit:
+        db, hit = best_hit
+        seq = hit.subject_sequence
+        db = db or ref_db
+        if db:
+            lab = get_blast_db_label(db)
     return (lab, seq)
 
 
 def inject_blast_result(
-    input_file: str, blast_hit_file: str, output_file: Optional[str] = None
+    input_file: str,
+    blast_hit_file: str,
+    output_file: Optional[str] = None,
+    max_evalue: Optional[float] = None,
+    min_bitscore: Optional[float] = None,
+    min_coverage: Optional[float] = None,
+    ref_db: Optional[str] = None,
 ) -> None:
     if not output_file:
         output_file = input_file.replace(".out", "")
     create_parent_directory(output_file)
-    lab, seq = parse_blast_result(blast_hit_file)
+    lab, seq = parse_blast_result(
+        blast_hit_file, max_evalue, min_bitscore, min_coverage, ref_db
+    )
     if lab and seq:
         with open(output_file, "a") as f:
             f.write(f">{lab}\n{seq}\n")
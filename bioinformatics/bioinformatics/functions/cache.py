@@ -0,0 +1,249 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from typing import Any, Callable, Optional
+from bioinformatics.functions.file_utils import generate_process
+
+# results of external tool calls are stored under a key built from the content
+# of every input, the identity of the tool binary and the argument vector;
+# entries are evicted least-recently-used once the cache exceeds its size limit
+cache_dir = os.environ.get("BIOINFORMATICS_CACHE_DIR", "bioinformatics/output/.cache")
+cache_size_limit = int(os.environ.get("BIOINFORMATICS_CACHE_SIZE", 20 * 1024**3))
+cache_enabled = os.environ.get("BIOINFORMATICS_CACHE", "1") != "0"
+# thread and memory flags (with their values) do not change a tool's output, so
+# they are left out of the key; flags only listed per tool mean something else
+# to other tools
+resource_flags = {"--threads", "-threads", "-num_threads"}
+tool_resource_flags = {"iqtree2": {"-T", "-mem"}}
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def hash_static_file(path: str, size: int, mtime: int) -> str:
+    # binaries and jars are hashed once per process for a given size/mtime
+    return hash_file(path)
+
+
+def file_identity(path: str) -> str:
+    stat = os.stat(path)
+    return hash_static_file(os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def tool_identity(program: str) -> str:
+    resolved = program if os.path.isfile(program) else shutil.which(program)
+    if resolved:
+        return file_identity(resolved)
+    return program
+
+
+def get_resource_flags(program: str) -> set[str]:
+    name = os.path.basename(program)
+    flags = set(resource_flags)
+    for tool, tool_flags in tool_resource_flags.items():
+        if name.startswith(tool):
+            flags.update(tool_flags)
+    return flags
+
+
+def cache_key(
+    cmd: list[str],
+    in_files: list[str],
+    out_files: Optional[list[str]] = None,
+    out_prefix: Optional[str] = None,
+) -> str:
+    # input/output paths are replaced by placeholders so that identical content
+    # in a different location still hits; other file arguments are hashed
+    placeholders = {x: f"<in{i}>" for i, x in enumerate(in_files)}
+    placeholders.update({x: f"<out{i}>" for i, x in enumerate(out_files or [])})
+    if out_prefix:
+        placeholders[out_prefix] = "<out_prefix>"
+    skip_flags = get_resource_flags(str(cmd[0])) if cmd else set()
+    digest = hashlib.sha256()
+    skip_value = False
+    for idx, token in enumerate(cmd):
+        token = str(token)
+        if skip_value:
+            skip_value = False
+            continue
+        if idx and token in skip_flags:
+            skip_value = True
+            continue
+        if token in placeholders:
+            part = placeholders[token]
+        elif idx == 0:
+            part = f"tool:{tool_identity(token)}"
+        elif os.path.isfile(token):
+            part = f"file:{file_identity(token)}"
+        else:
+            part = f"arg:{token}"
+        digest.update(part.encode() + b"\0")
+    for in_file in in_files:
+        digest.update(f"input:{hash_file(in_file)}".encode() + b"\0")
+    return digest.hexdigest()
+
+
+def function_key(
+    func: Callable[..., Any], in_files: list[str], out_files: list[str], *args, **kwargs
+) -> str:
+    # Python stages are keyed on the source file defining them and their arguments
+    cmd = [inspect.getsourcefile(func), f"{func.__module__}.{func.__qualname__}"]
+    cmd.extend(x if isinstance(x, str) else repr(x) for x in args)
+    cmd.extend(f"{k}={v!r}" for k, v in sorted(kwargs.items()))
+    return cache_key(cmd, in_files, out_files)
+
+
+def collect_prefix_outputs(out_prefix: str, since: float) -> list[str]:
+    parent = os.path.dirname(out_prefix) or "."
+    name = os.path.basename(out_prefix)
+    return sorted(
+        out_prefix + x[len(name) :]
+        for x in os.listdir(parent)
+        if x.startswith(name)
+        and x != name
+        and os.path.isfile(os.path.join(parent, x))
+        and os.path.getmtime(os.path.join(parent, x)) >= since
+    )
+
+
+def restore_cached(
+    key: str, out_files: Optional[list[str]] = None, out_prefix: Optional[str] = None
+) -> bool:
+    entry = os.path.join(cache_dir, key)
+    manifest_file = os.path.join(entry, "manifest.json")
+    if not os.path.exists(manifest_file):
+        return False
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    for name, stored in manifest["files"]:
+        if out_prefix:
+            target = out_prefix + name
+        else:
+            target = out_files[int(name)]
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        shutil.copyfile(os.path.join(entry, stored), target)
+    os.utime(entry)  # mark as recently used
+    return True
+
+
+def is_fresh_output(path: str, since: Optional[float] = None) -> bool:
+    # outputs left over from an earlier run are older than since
+    if not os.path.isfile(path):
+        return False
+    return since is None or os.path.getmtime(path) >= since
+
+
+def store_cached(
+    key: str,
+    out_files: Optional[list[str]] = None,
+    out_prefix: Optional[str] = None,
+    since: Optional[float] = None,
+) -> None:
+    if out_prefix:
+        files = [(x[len(out_prefix) :], x) for x in out_files]
+    else:
+        files = [
+            (str(i), x) for i, x in enumerate(out_files) if is_fresh_output(x, since)
+        ]
+    if not files:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key)
+    staging = tempfile.mkdtemp(dir=cache_dir, prefix=".staging_")
+    manifest = {"files": []}
+    for idx, (name, path) in enumerate(files):
+        shutil.copyfile(path, os.path.join(staging, str(idx)))
+        manifest["files"].append([name, str(idx)])
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    try:
+        os.rename(staging, entry)
+    except OSError:  # another worker stored the same result first
+        shutil.rmtree(staging, ignore_errors=True)
+    evict_cache()
+
+
+def get_entry_size(entry: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(entry, x))
+        for x in os.listdir(entry)
+        if os.path.isfile(os.path.join(entry, x))
+    )
+
+
+def evict_cache(size_limit: Optional[int] = None) -> None:
+    if size_limit is None:
+        size_limit = cache_size_limit
+    if not os.path.isdir(cache_dir):
+        return None
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if os.path.isdir(entry) and not name.startswith("."):
+            entries.append((os.path.getmtime(entry), get_entry_size(entry), entry))
+    total = sum(x[1] for x in entries)
+    for _, size, entry in sorted(entries):
+        if total <= size_limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def clear_cache() -> None:
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def cached_process(
+    cmd: list[str],
+    in_files: list[str],
+    out_files: Optional[list[str]] = None,
+    out_prefix: Optional[str] = None,
+    stdout: Optional[bool] = False,
+    cache: Optional[bool] = True,
+) -> None:
+    # out_prefix covers tools that write a family of files (IQ-TREE, makeblastdb)
+    in_files = [x for x in in_files if x]
+    if not (cache and cache_enabled):
+        generate_process(cmd, stdout, input_files=in_files)
+        return None
+    key = cache_key(cmd, in_files, out_files, out_prefix)
+    if restore_cached(key, out_files, out_prefix):
+        return None
+    # generate_process raises on a non-zero exit status, so only outputs of a
+    # successful run written after it started are stored
+    started = time.time() - 1
+    generate_process(cmd, stdout, input_files=in_files)
+    if out_prefix:
+        store_cached(key, collect_prefix_outputs(out_prefix, started), out_prefix)
+    else:
+        store_cached(key, out_files, since=started)
+
+
+def cached_call(
+    func: Callable[..., Any],
+    in_files: list[str],
+    out_files: list[str],
+    *args,
+    cache: Optional[bool] = True,
+    **kwargs,
+) -> None:
+    if not (cache and cache_enabled):
+        func(*args, **kwargs)
+        return None
+    key = function_key(func, in_files, out_files, *args, **kwargs)
+    if restore_cached(key, out_files):
+        return None
+    started = time.time() - 1
+    func(*args, **kwargs)
+    store_cached(key, out_files, since=started)
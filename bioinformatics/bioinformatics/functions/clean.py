@@ -1,7 +1,13 @@
 import os
 import re
-from typing import Optional
-from bioinformatics.functions.file_utils import inject_prefix_suffix
+from typing import Optional, Union
+import numpy as np
+from bioinformatics.functions.file_utils import (
+    create_parent_directory,
+    inject_prefix_suffix,
+)
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.models.alignment import Alignment
 
 
 def standardize_data_case(
@@ -42,11 +48,38 @@ def fasta_clean_newlines(input_file: str) -> None:
 special_chars = ["[", "]", "(", ")", "{", "}", "*", "+", "?", "|", "^", "$", ".", "\\"]
 
 
+def replace_ambiguous_matrix(
+    aln: Alignment, search_chars: list[str], replace_char: Optional[str] = "?"
+) -> Alignment:
+    table = np.arange(256, dtype=np.uint8)
+    for char in search_chars:
+        table[ord(char)] = ord(replace_char)
+    return Alignment(
+        table[aln.matrix], aln.ids, aln.descriptions, aln.lengths, aln.path
+    )
+
+
 def replace_ambiguous_chars(
-    in_file: str, search_chars: list[str], replace_char: Optional[str] = "?"
-) -> None:
+    in_file: Union[str, Alignment],
+    search_chars: list[str],
+    replace_char: Optional[str] = "?",
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
     # in_file = 'bioinformatics/output/alignments/muscle3/LEP1/trimmed/bmge/ORF1_L1.nex'
     # out_file = 'bioinformatics/output/alignments/muscle3/LEP1/trimmed/bmge/ORF1_L1_fmt.nex'
+    # a file written straight back out is rewritten line by line; in-memory
+    # alignments only have their sequence bytes recoded
+    if isinstance(in_file, Alignment) or not write:
+        aln = replace_ambiguous_matrix(
+            read_alignment(in_file), search_chars, replace_char
+        )
+        if aln.path:
+            aln.path = inject_prefix_suffix(aln.path, "", "_fmt")
+        if not write:
+            return aln
+        create_parent_directory(aln.path)
+        aln.write(aln.path)
+        return aln.path
     out_file = inject_prefix_suffix(in_file, "", "_fmt")
     search_chars = [f"\{x}" if x in special_chars else x for x in search_chars]
     regex = "|".join(search_chars)
@@ -54,3 +87,4 @@ def replace_ambiguous_chars(
         for line in f:
             new_line = re.sub(rf"{regex}", f"{replace_char}", line)
             f_out.write(new_line)
+    return out_file
@@ -1,18 +1,145 @@
 import re
-from typing import Optional, List
+from typing import Optional, List, Union
+import numpy as np
 from Bio import SeqIO
+from Bio.Seq import Seq
 from Bio.SeqIO import SeqRecord
-from Bio import AlignIO
-from Bio.Align import AlignInfo
 from bioinformatics.functions.file_utils import (
     parse_output_file_name,
     create_parent_directory,
 )
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.models.alignment import Alignment
 
+consensus_gap_chars = "-."
 
-def generate_consensus(fasta: str, threshold: Optional[float] = 0.5):
+# bit flags A=1, C=2, G=4, T=8 for every IUPAC nucleotide code
+iupac_bits = {
+    "A": 1,
+    "C": 2,
+    "M": 3,
+    "G": 4,
+    "R": 5,
+    "S": 6,
+    "V": 7,
+    "T": 8,
+    "U": 8,
+    "W": 9,
+    "Y": 10,
+    "H": 11,
+    "K": 12,
+    "D": 13,
+    "B": 14,
+    "N": 15,
+}
+iupac_codes = np.zeros(16, dtype=np.uint8)
+for code, bits in iupac_bits.items():
+    if code != "U":
+        iupac_codes[bits] = ord(code)
+
+
+def count_symbols(matrix: np.ndarray) -> np.ndarray:
+    # (256, sites) table of how often each byte value occurs in each column,
+    # built with a single bincount over the whole matrix
+    sites = matrix.shape[1]
+    index = matrix.astype(np.int64) * sites + np.arange(sites)
+    return np.bincount(index.ravel(), minlength=256 * sites).reshape(256, sites)
+
+
+def majority_consensus(
+    counts: np.ndarray,
+    thresholds: List[float],
+    ambiguous: str = "N",
+    gap_weight: float = 0.0,
+) -> List[bytes]:
+    # same rule as AlignInfo.SummaryInfo.dumb_consensus: a column takes its most
+    # frequent symbol if it is the single most frequent one and reaches the
+    # threshold, otherwise the ambiguous character. gap_weight > 0 counts gaps
+    # towards the column total and lets a gap win the column
+    gap_codes = [ord(x) for x in consensus_gap_chars]
+    gaps = counts[gap_codes].sum(axis=0)
+    atoms = counts.astype(float) if gap_weight else counts.copy()
+    atoms[gap_codes] = 0
+    total = atoms.sum(axis=0) + gap_weight * gaps
+    if gap_weight:
+        atoms[ord("-")] = gap_weight * gaps
+    best = atoms.argmax(axis=0)
+    max_size = atoms.max(axis=0)
+    single = np.count_nonzero(atoms == max_size, axis=0) == 1
+    ratio = np.divide(
+        max_size, total, out=np.zeros(len(total), dtype=float), where=total > 0
+    )
+    return [
+        np.where(single & (ratio >= threshold), best, ord(ambiguous))
+        .astype(np.uint8)
+        .tobytes()
+        for threshold in thresholds
+    ]
+
+
+def iupac_consensus(
+    counts: np.ndarray,
+    thresholds: List[float],
+    ambiguous: str = "N",
+    gap_weight: float = 0.0,
+) -> List[bytes]:
+    # each column takes the IUPAC code of the smallest set of bases (ties
+    # included) whose combined frequency reaches the threshold; ambiguity codes
+    # in the input are split evenly between the bases they stand for
+    gaps = counts[[ord(x) for x in consensus_gap_chars]].sum(axis=0)
+    bases = np.zeros((4, counts.shape[1]), dtype=float)
+    for code, bits in iupac_bits.items():
+        observed = counts[ord(code)] + counts[ord(code.lower())]
+        members = [i for i in range(4) if bits >> i & 1]
+        for i in members:
+            bases[i] += observed / len(members)
+    total = bases.sum(axis=0) + gap_weight * gaps
+    ranked = -np.sort(-bases, axis=0)
+    cumulative = np.cumsum(ranked, axis=0)
+    columns = np.arange(bases.shape[1])
+    gap_only = (bases.sum(axis=0) == 0) & (gaps > 0) & (gap_weight > 0)
+    consensus = []
+    for threshold in thresholds:
+        reached = cumulative >= threshold * total - 1e-9
+        resolved = reached.any(axis=0) & (total > 0)
+        cutoff = ranked[reached.argmax(axis=0), columns]
+        included = (bases >= cutoff) & (bases > 0)
+        bits = (included * np.array([1, 2, 4, 8])[:, None]).sum(axis=0)
+        seq = np.where(resolved & (bits > 0), iupac_codes[bits], ord(ambiguous))
+        seq = np.where(gap_only, ord("-"), seq)
+        consensus.append(seq.astype(np.uint8).tobytes())
+    return consensus
+
+
+def compute_consensus(
+    aln: Alignment,
+    thresholds: List[float],
+    iupac: bool = False,
+    ambiguous: str = "N",
+    gap_weight: float = 0.0,
+) -> List[str]:
+    counts = count_symbols(aln.matrix)
+    if iupac:
+        consensus = iupac_consensus(counts, thresholds, ambiguous, gap_weight)
+    else:
+        consensus = majority_consensus(counts, thresholds, ambiguous, gap_weight)
+    return [x.decode() for x in consensus]
+
+
+def generate_consensus(
+    fasta: Union[str, Alignment],
+    threshold: Optional[float] = 0.5,
+    thresholds: Optional[List[float]] = None,
+    iupac: bool = False,
+    gap_weight: float = 0.0,
+    ambiguous: str = "N",
+) -> Optional[str]:
     # fasta = 'bioinformatics/output/taxon_filtered_alignments/ZFMK1/EOG090R0A51_3.final.out.fas'
-    output_file = parse_output_file_name(fasta, 'output/consensus_sequences').replace(".out.out", ".out")
+    # one record per threshold is written; all thresholds come from one count
+    source = fasta.path if isinstance(fasta, Alignment) else fasta
+    output_file = parse_output_file_name(source, "output/consensus_sequences").replace(
+        ".out.out", ".out"
+    )
     # subfolders_to_replace = "/".join(
     #     output_file.split("/")[output_file.split("/").index("output") + 1 : -2]
     # )
@@ -22,17 +149,37 @@ def generate_consensus(fasta: str, threshold: Optional[float] = 0.5):
         .group(1)
         .replace("/", ".")
     )
+    if not thresholds:
+        thresholds = [threshold]
     try:
-        alignment = AlignIO.read(fasta, "fasta")
+        alignment = read_alignment(fasta, "fasta")
+        if not len(alignment) or not alignment.is_aligned():
+            raise ValueError("Sequences must all be the same length")
     except:
         print("Alignment was empty or malformed. Skipping.")
         pass
     else:
-        summary_align = AlignInfo.SummaryInfo(alignment)
-        consensus = summary_align.dumb_consensus(threshold, "N")
-        my_seqs = SeqRecord(
-            consensus, id="", description=f"{locus_name}_{threshold*100}%_consensus"
+        consensus = compute_consensus(
+            alignment, thresholds, iupac, ambiguous, gap_weight
         )
+        my_seqs = [
+            SeqRecord(
+                Seq(seq),
+                id=f"{locus_name}_{threshold*100}%_consensus",
+                description="",
+            )
+            for threshold, seq in zip(thresholds, consensus)
+        ]
         create_parent_directory(output_file)
         SeqIO.write(my_seqs, output_file, "fasta")
+        return output_file
+
 
+def combine_consensus_files(consensus_files: List[str], out_file: str) -> None:
+    # single multi-FASTA of every locus consensus, e.g. as input to create_blast_db
+    create_parent_directory(out_file)
+    with open(out_file, "w") as f_out:
+        for consensus_file in consensus_files:
+            with open(consensus_file) as f:
+                for line in f:
+                    f_out.write(line)
@@ -0,0 +1,39 @@
+import mmap
+import os
+from typing import Iterator
+from bioinformatics.models.sequence import FastaRecord
+
+whitespace = b" \t\r\n"
+
+
+def iter_fasta_bytes(in_file: str, headers_only: bool = False) -> Iterator[FastaRecord]:
+    # walks a memory-mapped FASTA file without building SeqRecords. A sequence
+    # on a single line is yielded as a view into the mapping; only wrapped
+    # sequences are copied, when their lines are joined. The mapping stays open
+    # while any yielded view is alive
+    with open(in_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    # anything before the first header is skipped
+    start = 0 if mm[:1] == b">" else mm.find(b"\n>")
+    if start != -1 and mm[start] != ord(">"):
+        start += 1
+    while start != -1:
+        header_end = mm.find(b"\n", start)
+        if header_end == -1:
+            header_end = len(mm)
+        next_start = mm.find(b"\n>", header_end)
+        seq_end = len(mm) if next_start == -1 else next_start
+        title = mm[start + 1 : header_end].decode().strip()
+        seq = None
+        if not headers_only:
+            seq_start = min(header_end + 1, seq_end)
+            while seq_end > seq_start and mm[seq_end - 1] in whitespace:
+                seq_end -= 1
+            seq = view[seq_start:seq_end]
+            if any(mm.find(x, seq_start, seq_end) != -1 for x in (b"\n", b"\r", b" ")):
+                seq = memoryview(bytes(seq).translate(None, whitespace))
+        yield FastaRecord(title.split(None, 1)[0] if title else "", title, seq)
+        start = next_start if next_start == -1 else next_start + 1
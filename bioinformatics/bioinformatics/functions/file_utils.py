@@ -1,11 +1,21 @@
 from logging import raiseExceptions
+import json
 import os
 import platform as pform
 import shutil
 import re
-from typing import Optional
+import time
+from datetime import datetime
+from typing import Optional, Union
 import subprocess
 
+# every external tool call is appended to this JSON-lines log with its exit
+# status, wall/CPU time and peak memory
+run_log_file = os.environ.get(
+    "BIOINFORMATICS_RUN_LOG", "bioinformatics/output/.run_log.jsonl"
+)
+run_log_enabled = os.environ.get("BIOINFORMATICS_RUN_LOG_ENABLED", "1") != "0"
+
 
 def list_files(input_folder: str) -> list[str]:
     file_list = []
@@ -30,21 +40,72 @@ def parse_output_file_name(in_file: str, output_folder: str = "output") -> str:
 #     subprocess.check_output(cmd).decode("utf-8")
 
 
+def get_input_bytes(input_files: list[str]) -> int:
+    return sum(os.path.getsize(x) for x in input_files if x and os.path.isfile(x))
+
+
+def write_run_log(record: dict, log_file: Optional[str] = None) -> None:
+    log_file = log_file or run_log_file
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    with open(log_file, "a") as f:  # one short append per record
+        f.write(json.dumps(record) + "\n")
+
+
 def generate_process(
-    cmd: str, stdout: Optional[bool] = False, output_result: Optional[bool] = False
-) -> str:
-    if stdout:
-        subprocess.run(cmd)
-        if output_result:
-            return subprocess.check_output(cmd).decode("utf-8")
+    cmd: Union[str, list[str]],
+    stdout: Optional[bool] = False,
+    output_result: Optional[bool] = False,
+    input_files: Optional[list[str]] = None,
+    check: Optional[bool] = True,
+) -> Optional[str]:
+    # the child is reaped with wait4 so its own CPU time and peak RSS can be
+    # recorded; with output_result its stdout is captured from the same run.
+    # input_files are the tool's inputs (sized for the log); with check a
+    # non-zero exit status raises CalledProcessError once the run is logged
+    args = [cmd] if isinstance(cmd, str) else [str(x) for x in cmd]
+    input_bytes = None if input_files is None else get_input_bytes(input_files)
+    if output_result:
+        out_stream = subprocess.PIPE
+    else:
+        out_stream = None if stdout else subprocess.DEVNULL
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        args,
+        stdout=out_stream,
+        stderr=None if stdout else subprocess.STDOUT,
+    )
+    output = process.stdout.read() if output_result else None
+    usage = None
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
     else:
-        subprocess.run(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.STDOUT,
+        process.wait()
+    wall_seconds = time.perf_counter() - started
+    if output_result:
+        process.stdout.close()
+    if run_log_enabled:
+        write_run_log(
+            {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "tool": os.path.basename(args[0]),
+                "args": args[1:],
+                "input_bytes": input_bytes,
+                "exit_status": process.returncode,
+                "wall_seconds": round(wall_seconds, 3),
+                "user_seconds": round(usage.ru_utime, 6) if usage else None,
+                "sys_seconds": round(usage.ru_stime, 6) if usage else None,
+                # ru_maxrss is in KB on Linux
+                "max_rss_mb": round(usage.ru_maxrss / 1024, 1) if usage else None,
+            }
         )
-        if output_result:
-            return subprocess.check_output(cmd).decode("utf-8")
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, output)
+    if output_result:
+        result = output.decode("utf-8")
+        if stdout:
+            print(result, end="")
+        return result
     return None
 
 
@@ -1,67 +1,121 @@
-import re
-from Bio import SeqIO
+from typing import Optional, Union
+import numpy as np
 from bioinformatics.functions.file_utils import (
-    suffix_parser,
+    create_parent_directory,
+    inject_parent_directory,
+    replace_suffix,
 )
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.models.alignment import Alignment
 
 
-def compile_gap_pattern(gap_chars: list[str]):
-    pattern = ""
-    for char in gap_chars:
-        pattern = pattern + f"{char}+|"
-    pattern = re.sub(r"\|$", "", pattern)
-    pattern = pattern.replace("?", "\?")
-    return pattern
+def get_gap_mask(
+    aln: Alignment,
+    gap_chars: list[str] = ["-", "X", "?"],
+    ignore_trailing_ambigs: bool = True,
+) -> np.ndarray:
+    # True where a row holds a gap char; fill beyond a row's true length never
+    # counts and a trailing run of 1-3 gap chars (a partial codon) is dropped
+    columns = np.arange(aln.width)
+    mask = np.isin(aln.matrix, np.frombuffer("".join(gap_chars).encode(), np.uint8))
+    mask &= columns < aln.lengths[:, None]
+    if ignore_trailing_ambigs:
+        residues = ~mask & (columns < aln.lengths[:, None])
+        last_residue = np.where(
+            residues.any(axis=1), aln.width - 1 - residues[:, ::-1].argmax(axis=1), -1
+        )
+        trailing = aln.lengths - 1 - last_residue
+        mask &= ~((trailing <= 3)[:, None] & (columns > last_residue[:, None]))
+    return mask
+
+
+def get_gap_runs(mask: np.ndarray) -> np.ndarray:
+    # run-length encodes every row at once: (row, start, end) per gap, end exclusive
+    edges = np.diff(np.pad(mask.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return np.column_stack([rows, starts, ends])
 
 
 def find_unique_gaps(
-    in_file: str,
+    in_file: Union[str, Alignment],
     gap_chars: list[str] = ["-", "X", "?"],
     score_together: bool = True,
     filter: list[str] = ["start", "end", "center"],
     ignore_trailing_ambigs: bool = True,
-) -> set[tuple[int, int]]:
+) -> list[tuple[int, int]]:
     # in_file = 'bioinformatics/output/alignments/clustal_omega/LEP1/L1.fa'
     # in_file = 'bioinformatics/output/alignments/muscle3/LEP1/trimmed/augment/ORF1_L1_fmt.nex'
-    if suffix_parser(in_file) == "phylip":
-        file_format = "phylip-relaxed"
-    else:
-        file_format = suffix_parser(in_file)
-    aln_base = SeqIO.parse(in_file, file_format)
-    gaps = set()
+    # score_together=False finds runs of each gap char separately
+    aln_base = read_alignment(in_file)
     if score_together:
-        pattern = "|".join(gap_chars).replace("?", "\?")
+        masks = [get_gap_mask(aln_base, gap_chars, ignore_trailing_ambigs)]
     else:
-        pattern = compile_gap_pattern(gap_chars)
-    for seq in aln_base:
-        sequence = str(seq.seq)
-        if ignore_trailing_ambigs:
-            subpattern = ("|".join(gap_chars) + "{1,3}").replace("?", "\\?")
-            sequence = re.sub(rf"{subpattern}$", "", sequence)
-        gap_list = [x.span() for x in re.finditer(rf"[{pattern}]+", sequence)]
-        if gap_list:
-            gaps = gaps | set(gap_list)
-    gaps_out = set()
+        masks = [get_gap_mask(aln_base, [x], ignore_trailing_ambigs) for x in gap_chars]
+    runs = np.concatenate([get_gap_runs(x) for x in masks])
+    gaps = np.unique(runs[:, 1:], axis=0) if len(runs) else np.empty((0, 2), int)
+    end = aln_base.lengths[-1]
+    keep = np.zeros(len(gaps), dtype=bool)
     if "start" in filter:
-        gaps_out = gaps_out | {s for s in list(gaps) if s[0] == 0}
+        keep |= gaps[:, 0] == 0
     if "center" in filter:
-        gaps_out = gaps_out | {
-            s for s in list(gaps) if s[0] != 0 and s[1] != len(seq.seq)
-        }
+        keep |= (gaps[:, 0] != 0) & (gaps[:, 1] != end)
     if "end" in filter:
-        gaps_out = gaps_out | {s for s in list(gaps) if s[1] == len(seq.seq)}
-    gaps_out = sorted(gaps_out)
-    return gaps_out
+        keep |= gaps[:, 1] == end
+    return [(int(x[0]), int(x[1])) for x in gaps[keep]]
 
 
-def score_gaps(in_file: str, gaps: set[tuple[int, int]]):
-    score_matrix = {}
-    if suffix_parser(in_file) == "phylip":
-        file_format = "phylip-relaxed"
-    else:
-        file_format = suffix_parser(in_file)
-    aln_base = SeqIO.parse(in_file, file_format)
-    # for gap in gaps:
-    #     for seq in aln_base:
-    # check if gap overlaps the next gap
-    return score_matrix
+def score_gaps(
+    in_file: Union[str, Alignment],
+    gaps: Optional[list[tuple[int, int]]] = None,
+    gap_chars: list[str] = ["-", "X", "?"],
+    ignore_trailing_ambigs: bool = True,
+) -> Alignment:
+    # simple indel coding (Simmons & Ochoterena 2000): one binary character per
+    # gap, scored 1 where a row has exactly that gap, ? where it lies inside a
+    # larger gap of that row and 0 otherwise. Containment is read off per-row
+    # prefix sums of the gap mask, so every row and gap is scored at once
+    aln_base = read_alignment(in_file)
+    if gaps is None:
+        gaps = find_unique_gaps(
+            aln_base, gap_chars, ignore_trailing_ambigs=ignore_trailing_ambigs
+        )
+    mask = get_gap_mask(aln_base, gap_chars, ignore_trailing_ambigs)
+    starts = np.array([x[0] for x in gaps], dtype=np.int64)
+    ends = np.array([x[1] for x in gaps], dtype=np.int64)
+    gap_counts = np.pad(np.cumsum(mask, axis=1), ((0, 0), (1, 0)))
+    covered = gap_counts[:, ends] - gap_counts[:, starts] == ends - starts
+    bounded = np.pad(mask, ((0, 0), (1, 1)))
+    opens = ~bounded[:, starts]
+    closes = ~bounded[:, ends + 1]
+    scores = np.where(
+        covered & opens & closes, ord("1"), np.where(covered, ord("?"), ord("0"))
+    ).astype(np.uint8)
+    return Alignment(scores, aln_base.ids, aln_base.descriptions, None, aln_base.path)
+
+
+def get_gap_coded_file(in_file: str) -> str:
+    return replace_suffix(inject_parent_directory(in_file, "gap_coded"), "fasta")
+
+
+def code_gaps(
+    in_file: Union[str, Alignment],
+    gap_chars: list[str] = ["-", "X", "?"],
+    filter: list[str] = ["start", "end", "center"],
+    append: bool = False,
+    write: bool = True,
+) -> Union[str, Alignment]:
+    # writes the indel characters alone, or appended after the sequence columns
+    aln_base = read_alignment(in_file)
+    gaps = find_unique_gaps(aln_base, gap_chars, filter=filter)
+    scores = score_gaps(aln_base, gaps, gap_chars)
+    if append:
+        scores.matrix = np.hstack([aln_base.matrix, scores.matrix])
+        scores.lengths = np.full(len(scores), scores.width)
+    output_file = get_gap_coded_file(aln_base.path) if aln_base.path else None
+    scores.path = output_file
+    if not write:
+        return scores
+    create_parent_directory(output_file)
+    scores.write(output_file, "fasta")
+    return output_file
@@ -1,19 +1,45 @@
-from io import TextIOWrapper
-from typing import Optional, List
+from io import BufferedWriter, TextIOWrapper
+from typing import Iterator, Optional, List, Union
 from Bio import SeqIO, SeqRecord
 from Bio.SeqIO.FastaIO import FastaIterator
+from bioinformatics.functions.fasta import iter_fasta_bytes
 from bioinformatics.functions.file_utils import (
     parse_output_file_name,
     suffix_parser,
 )
+from bioinformatics.models.alignment import Alignment
+from bioinformatics.models.sequence import FastaRecord
+from bioinformatics.functions.matcher import (
+    LabelMatcher,
+    compile_label_filter,
+    label_matches,
+)
 
 
-def read_seq_file(in_file: str) -> SeqIO:
+def read_seq_file(
+    in_file: str, backend: Optional[str] = "biopython", headers_only: bool = False
+) -> Union[SeqIO, Iterator[FastaRecord]]:
+    # backend="bytes" reads FASTA as FastaRecords over the raw file bytes, for
+    # scans that only need labels or lengths
     suffix = suffix_parser(in_file)
+    if backend == "bytes":
+        if suffix != "fasta":
+            raise ValueError(f"bytes backend only reads fasta, not {suffix}")
+        return iter_fasta_bytes(in_file, headers_only)
     records = SeqIO.parse(in_file, suffix)
     return records
 
 
+def read_alignment(
+    alignment: Union[str, Alignment], file_format: Optional[str] = None
+) -> Alignment:
+    # stages accept either a path or an already parsed Alignment so a locus can
+    # be parsed once and handed from stage to stage
+    if isinstance(alignment, Alignment):
+        return alignment
+    return Alignment.from_file(alignment, file_format)
+
+
 def write_seq_file(
     records: list[SeqRecord.SeqRecord], out_file: str, suffix: str
 ) -> None:
@@ -21,44 +47,56 @@ def write_seq_file(
 
 
 def substring_label_search(
-    record: FastaIterator, filter: List[str], output_file: TextIOWrapper
+    record: FastaIterator,
+    filter: Union[List[str], LabelMatcher],
+    output_file: TextIOWrapper,
 ) -> bool:
-    discovered = False
-    for substring in filter:
-        if substring in record.description:
-            output_file.write(f">{record.id}\n{record.seq}\n")
-            discovered = True
+    discovered = label_matches(compile_label_filter(filter), record.description)
+    if discovered:
+        output_file.write(f">{record.id}\n{record.seq}\n")
     return discovered
 
 
+def write_fasta_record(record: FastaRecord, output_file: BufferedWriter) -> None:
+    output_file.write(f">{record.id}\n".encode())
+    output_file.write(record.seq)
+    output_file.write(b"\n")
+
+
 def filter_fasta_by_label(
-    fasta: str, primary_filter: List[str], secondary_filter: Optional[List[str]]
+    fasta: str,
+    primary_filter: Union[List[str], LabelMatcher],
+    secondary_filter: Optional[Union[List[str], LabelMatcher]],
 ):
+    # single pass: primary matches are written straight away, secondary matches
+    # are buffered and only written if no primary match was found
+    primary_matcher = compile_label_filter(primary_filter)
+    secondary_matcher = compile_label_filter(secondary_filter)
     output_file = parse_output_file_name(fasta, "output/taxon_filtered_alignments")
     lab_found = False
-    with open(output_file, "w") as f:
-        for seq_record in SeqIO.parse(fasta, "fasta"):
-            discovered = substring_label_search(seq_record, primary_filter, f)
-            if discovered:
+    fallback = []
+    with open(output_file, "wb") as f:
+        for seq_record in iter_fasta_bytes(fasta):
+            if label_matches(primary_matcher, seq_record.description):
+                write_fasta_record(seq_record, f)
                 lab_found = True
+            elif not lab_found and label_matches(
+                secondary_matcher, seq_record.description
+            ):
+                fallback.append(seq_record)
         if not lab_found:
-            for seq_record in SeqIO.parse(fasta, "fasta"):
-                discovered = substring_label_search(seq_record, secondary_filter, f)
-                if discovered:
-                    lab_found = True
-        #     if lab_found:
-        #         print(f"Substitute Was Required & Found For: {output_file}")
-        #     else:
-        #         print(f"No Substitute Available For: {output_file}")
-        # else:
-        #     print(f"Taxa Grabbed for: {output_file}")
-
-
-def get_all_tips(fasta: str, tip_list: str = []):
-    for seq_record in SeqIO.parse(fasta, "fasta"):
-        locus_name = ".".join(fasta.split("/")[-1].split(".")[0:-1])
+            for seq_record in fallback:
+                write_fasta_record(seq_record, f)
+
+
+def get_all_tips(fasta: str, tip_list: Optional[list[str]] = None) -> list[str]:
+    tip_list = [] if tip_list is None else tip_list
+    seen = set(tip_list)
+    locus_name = ".".join(fasta.split("/")[-1].split(".")[0:-1])
+    for seq_record in iter_fasta_bytes(fasta, headers_only=True):
         name = seq_record.description.replace(f"{locus_name}", "")
-        if not name in tip_list:
+        if name not in seen:
+            seen.add(name)
             tip_list.append(name)
     return tip_list
 
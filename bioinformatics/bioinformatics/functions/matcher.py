@@ -0,0 +1,62 @@
+from collections import deque
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Union
+
+
+class LabelMatcher(NamedTuple):
+    # Aho-Corasick automaton: goto transitions, failure links and a flag marking
+    # states where at least one pattern ends
+    goto: list[dict[str, int]]
+    fail: list[int]
+    terminal: list[bool]
+
+
+@lru_cache(maxsize=32)
+def build_label_matcher(patterns: tuple[str, ...]) -> LabelMatcher:
+    goto = [{}]
+    terminal = [False]
+    for pattern in patterns:
+        state = 0
+        for char in pattern:
+            if char not in goto[state]:
+                goto.append({})
+                terminal.append(False)
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        terminal[state] = True
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, child in goto[state].items():
+            queue.append(child)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[child] = goto[fallback].get(char, 0)
+            if fail[child] == child:
+                fail[child] = 0
+            terminal[child] = terminal[child] or terminal[fail[child]]
+    return LabelMatcher(goto, fail, terminal)
+
+
+def compile_label_filter(
+    label_filter: Union[Iterable[str], LabelMatcher, None]
+) -> LabelMatcher:
+    if isinstance(label_filter, LabelMatcher):
+        return label_filter
+    return build_label_matcher(tuple(sorted(set(label_filter or []))))
+
+
+def label_matches(matcher: LabelMatcher, text: str) -> bool:
+    goto, fail, terminal = matcher
+    if terminal[0]:  # empty pattern matches everything
+        return True
+    state = 0
+    for char in text:
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        if terminal[state]:
+            return True
+    return False
@@ -0,0 +1,144 @@
+import os
+from typing import Optional
+import numpy as np
+from bioinformatics.functions.fasta import iter_fasta_bytes
+from bioinformatics.functions.file_utils import create_parent_directory, list_files
+from bioinformatics.functions.parallel import run_parallel
+from bioinformatics.models.sequence import OccupancyIndex
+
+# input_folder = 'bioinformatics/input/fasta/LEP1'
+# index_file = 'bioinformatics/output/occupancy/LEP1.npz'
+missing_chars = np.frombuffer(b"-?NXnx.", dtype=np.uint8)
+
+
+def get_occupancy_index_file(input_folder: str) -> str:
+    dataset = os.path.basename(input_folder.rstrip("/"))
+    return f"bioinformatics/output/occupancy/{dataset}.npz"
+
+
+def get_locus_label(fasta: str) -> str:
+    return ".".join(fasta.split("/")[-1].split(".")[0:-1])
+
+
+def scan_locus_occupancy(fasta: str) -> list[tuple[str, int, int]]:
+    # (taxon, sequence length, non-missing characters) per record; the locus
+    # name is stripped from the header as in get_all_tips
+    locus_name = get_locus_label(fasta)
+    entries = []
+    for record in iter_fasta_bytes(fasta):
+        seq = np.frombuffer(record.seq, dtype=np.uint8)
+        entries.append(
+            (
+                record.description.replace(locus_name, ""),
+                len(seq),
+                len(seq) - int(np.isin(seq, missing_chars).sum()),
+            )
+        )
+    return entries
+
+
+def empty_occupancy_index() -> OccupancyIndex:
+    return OccupancyIndex(
+        np.array([], dtype=str),
+        np.array([], dtype=str),
+        np.array([], dtype=np.int64),
+        np.array([], dtype=np.int64),
+        np.array([], dtype=np.int64),
+        np.array([], dtype=np.int64),
+        np.array([], dtype=np.int64),
+    )
+
+
+def load_occupancy_index(index_file: str) -> OccupancyIndex:
+    if not os.path.exists(index_file):
+        return empty_occupancy_index()
+    with np.load(index_file) as data:
+        return OccupancyIndex(*(data[x] for x in OccupancyIndex._fields))
+
+
+def save_occupancy_index(index: OccupancyIndex, index_file: str) -> None:
+    create_parent_directory(index_file)
+    with open(index_file + ".tmp", "wb") as f:
+        np.savez_compressed(f, **index._asdict())
+    os.replace(index_file + ".tmp", index_file)
+
+
+def update_occupancy_index(
+    input_folder: str, index_file: str, jobs: Optional[int] = 1
+) -> OccupancyIndex:
+    # only locus files that are new or modified since the last update are
+    # scanned (in parallel); loci whose files were removed are dropped
+    index = load_occupancy_index(index_file)
+    files = sorted(list_files(input_folder))
+    modified = {x: os.stat(x).st_mtime_ns for x in files}
+    known = dict(zip(index.loci.tolist(), index.modified.tolist()))
+    changed = [x for x in files if known.get(x) != modified[x]]
+    if not changed and len(known) == len(files):
+        return index
+    scans, _ = run_parallel(scan_locus_occupancy, changed, jobs=jobs)
+    kept_cols = [
+        idx
+        for idx, x in enumerate(index.loci.tolist())
+        if x in modified and known[x] == modified[x]
+    ]
+    keep = np.isin(index.cols, kept_cols)
+    loci = index.loci[kept_cols].tolist()
+    loci += [x for x, scan in zip(changed, scans) if scan is not None]
+    locus_ids = {x: idx for idx, x in enumerate(loci)}
+    old_taxa = index.taxa[index.rows[keep]].tolist()
+    old_loci = index.loci[index.cols[keep]].tolist()
+    new_taxa, new_loci, new_lengths, new_residues = [], [], [], []
+    for locus, scan in zip(changed, scans):
+        for taxon, length, residues in scan or []:
+            new_taxa.append(taxon)
+            new_loci.append(locus)
+            new_lengths.append(length)
+            new_residues.append(residues)
+    taxa, rows = np.unique(
+        np.array(old_taxa + new_taxa, dtype=str), return_inverse=True
+    )
+    index = OccupancyIndex(
+        taxa,
+        np.array(loci, dtype=str),
+        np.array([modified[x] for x in loci], dtype=np.int64),
+        rows.astype(np.int64),
+        np.array([locus_ids[x] for x in old_loci + new_loci], dtype=np.int64),
+        np.concatenate([index.lengths[keep], np.array(new_lengths, dtype=np.int64)]),
+        np.concatenate([index.residues[keep], np.array(new_residues, dtype=np.int64)]),
+    )
+    save_occupancy_index(index, index_file)
+    return index
+
+
+def get_taxon_loci(index: OccupancyIndex, taxon: str) -> list[str]:
+    rows = np.flatnonzero(index.taxa == taxon)
+    if not len(rows):
+        return []
+    return index.loci[np.unique(index.cols[index.rows == rows[0]])].tolist()
+
+
+def get_locus_taxa(index: OccupancyIndex, locus: str) -> list[str]:
+    cols = np.flatnonzero(index.loci == locus)
+    if not len(cols):
+        return []
+    return index.taxa[np.unique(index.rows[index.cols == cols[0]])].tolist()
+
+
+def get_taxon_occupancy(
+    index: OccupancyIndex, min_residues: Optional[int] = 1
+) -> np.ndarray:
+    # fraction of loci each taxon (in index.taxa order) has at least min_residues
+    # non-missing characters in; duplicate records in a locus count once
+    present = index.residues >= min_residues
+    pairs = np.unique(
+        index.rows[present] * max(len(index.loci), 1) + index.cols[present]
+    )
+    counts = np.bincount(pairs // max(len(index.loci), 1), minlength=len(index.taxa))
+    return counts / max(len(index.loci), 1)
+
+
+def get_occupied_taxa(
+    index: OccupancyIndex, min_fraction: float, min_residues: Optional[int] = 1
+) -> list[str]:
+    occupancy = get_taxon_occupancy(index, min_residues)
+    return index.taxa[occupancy >= min_fraction].tolist()
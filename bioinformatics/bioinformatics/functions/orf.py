@@ -1,12 +1,17 @@
 import re
-from typing import List, Optional
+from typing import List, Optional, Union
 from Bio import SeqIO, Seq, SeqRecord
 import numpy as np
+from Bio.Data.IUPACData import ambiguous_dna_complement
 from bioinformatics.functions.file_utils import (
     inject_grandparent_directory,
     inject_prefix_suffix,
     create_parent_directory,
 )
+from bioinformatics.functions.cache import cached_call
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.models.alignment import Alignment
+from bioinformatics.functions.parallel import run_parallel
 
 stop_codon_code = "*"
 unresolvable_codon_code = "X"
@@ -116,6 +121,73 @@ dna_code = {
 }
 
 
+# vectorized translation: every byte is mapped to a small base code (0 for
+# anything not used by dna_code) and every codon to an index into a lookup table
+codon_bases = sorted({base for codon in dna_code for base in codon})
+base_codes = np.zeros(256, dtype=np.uint8)
+for code, base in enumerate(codon_bases, start=1):
+    base_codes[ord(base)] = code
+codon_radix = len(codon_bases) + 1
+codon_table = np.full(codon_radix**3, ord(unresolvable_codon_code), dtype=np.uint8)
+for codon, amino_acid in dna_code.items():
+    codon_table[
+        int(base_codes[ord(codon[0])]) * codon_radix**2
+        + int(base_codes[ord(codon[1])]) * codon_radix
+        + int(base_codes[ord(codon[2])])
+    ] = ord(amino_acid)
+
+complement_table = np.arange(256, dtype=np.uint8)
+for base, complement in ambiguous_dna_complement.items():
+    complement_table[ord(base)] = ord(complement)
+    complement_table[ord(base.lower())] = ord(complement.lower())
+
+
+def encode_sequences(seqs: List[str], fill_char: str = "-") -> np.ndarray:
+    ids = [str(x) for x in range(len(seqs))]
+    return Alignment.from_sequences(ids, seqs, fill_char=fill_char).matrix
+
+
+def reverse_complement_matrix(matrix: np.ndarray) -> np.ndarray:
+    return complement_table[matrix[:, ::-1]]
+
+
+def translate_matrix(matrix: np.ndarray, orf: int) -> np.ndarray:
+    # same framing as translate_orf: ORF 1 shifts by one gap, ORF 3 by two, and a
+    # trailing partial codon translates to the unresolvable code
+    shift = {1: 1, 2: 0, 3: 2}[orf]
+    codes = base_codes[matrix]
+    if shift:
+        codes = np.concatenate(
+            [
+                np.full((codes.shape[0], shift), base_codes[ord("-")], np.uint8),
+                codes,
+            ],
+            axis=1,
+        )
+    complete = codes.shape[1] // 3
+    triplets = codes[:, : complete * 3].reshape(codes.shape[0], complete, 3)
+    index = (
+        triplets[:, :, 0].astype(np.intp) * codon_radix**2
+        + triplets[:, :, 1].astype(np.intp) * codon_radix
+        + triplets[:, :, 2]
+    )
+    translated = codon_table[index]
+    if codes.shape[1] % 3:
+        partial = np.full(
+            (codes.shape[0], 1), ord(unresolvable_codon_code), dtype=np.uint8
+        )
+        translated = np.concatenate([translated, partial], axis=1)
+    return translated
+
+
+def translate_frames(matrix: np.ndarray) -> list[np.ndarray]:
+    # ordered as ORFs 1-3 on the forward strand, then 4-6 on the reverse strand
+    reverse = reverse_complement_matrix(matrix)
+    return [translate_matrix(matrix, orf) for orf in [1, 2, 3]] + [
+        translate_matrix(reverse, orf) for orf in [1, 2, 3]
+    ]
+
+
 def translate_orf(seq: Seq, orf: int, dna_code: dict[str, str]):
     if orf == 1:
         seq = "-" + seq
@@ -127,18 +199,14 @@ def translate_orf(seq: Seq, orf: int, dna_code: dict[str, str]):
     return seq_translated
 
 
-def orf_score(orf_sets):
-    unique_aa_per_site = [np.apply_along_axis(lambda a: len(set(a)), 0, orf_sets)][0]
-    return sum(unique_aa_per_site) / len(unique_aa_per_site)
+def orf_score(orf_sets) -> float:
+    # mean number of distinct amino acids per column
+    ordered = np.sort(np.asarray(orf_sets), axis=0)
+    unique_aa_per_site = 1 + np.count_nonzero(ordered[1:] != ordered[:-1], axis=0)
+    return unique_aa_per_site.sum() / len(unique_aa_per_site)
 
 
-def find_best_orf(seq_list: List[str]) -> int:
-    orf_scores = list(
-        map(
-            orf_score,
-            seq_list,
-        )
-    )
+def select_orf(orf_scores: List[float]) -> int:
     matches = [i for i, x in enumerate(orf_scores) if x == min(orf_scores)]
     if len(matches) == 1:
         match = matches[0] + 1
@@ -148,51 +216,106 @@ def find_best_orf(seq_list: List[str]) -> int:
     return match
 
 
-def get_best_orf(in_file: str) -> int:
+def find_best_orf(seq_list: List[str]) -> int:
+    return select_orf(list(map(orf_score, seq_list)))
+
+
+def score_orfs(matrix: np.ndarray) -> list[float]:
+    return [orf_score(frame) for frame in translate_frames(matrix)]
+
+
+def score_orfs_batch(matrices: List[np.ndarray]) -> np.ndarray:
+    # one row of six ORF scores per locus
+    return np.array([score_orfs(matrix) for matrix in matrices], dtype=float)
+
+
+def read_dna_matrix(in_file: Union[str, Alignment]) -> np.ndarray:
+    return read_alignment(in_file).matrix
+
+
+def get_best_orf(in_file: Union[str, Alignment]) -> int:
     # in_file = 'bioinformatics/output/alignments/clustal_omega/LEP1/L1.fa'
-    # get alignment
-    aln_base = SeqIO.parse(in_file, "fasta")
-    orf_list = []
-    forward_orf1 = []
-    reverse_orf1 = []
-    forward_orf2 = []
-    reverse_orf2 = []
-    forward_orf3 = []
-    reverse_orf3 = []
-    for seq in aln_base:
-        seq_data = seq.seq
-        rev_seq_data = seq.seq.reverse_complement()
-        forward_orf1.append(translate_orf(seq_data, 1, dna_code))
-        reverse_orf1.append(translate_orf(rev_seq_data, 1, dna_code))
-        forward_orf2.append(translate_orf(seq_data, 2, dna_code))
-        reverse_orf2.append(translate_orf(rev_seq_data, 2, dna_code))
-        forward_orf3.append(translate_orf(seq_data, 3, dna_code))
-        reverse_orf3.append(translate_orf(rev_seq_data, 3, dna_code))
-    orf_list.extend(
-        [
-            forward_orf1,
-            forward_orf2,
-            forward_orf3,
-            reverse_orf1,
-            reverse_orf2,
-            reverse_orf3,
-        ]
-    )
-    return find_best_orf(orf_list)
+    return select_orf(score_orfs(read_dna_matrix(in_file)))
 
 
-def fix_dna_alignment(in_file: str, best_orf: Optional[int] = None):
+def get_best_orfs(in_files: List[str], jobs: Optional[int] = 1) -> dict[str, int]:
+    best_orfs, _ = run_parallel(get_best_orf, in_files, jobs=jobs)
+    return dict(zip(in_files, best_orfs))
+
+
+def set_matrix_to_orf1(aln: Alignment, best_orf: int) -> Alignment:
+    # vectorized set_to_orf1 over every row: shift to ORF 1 with leading
+    # N/gap characters, then extend each row to a whole number of codons
+    if best_orf in [2, 5]:
+        shift = 0
+    elif best_orf in [3, 6]:
+        shift = 2
+    elif best_orf in [1, 4]:
+        shift = 1
+    gap = ord("-")
+    rows = np.arange(len(aln))
+    lengths = aln.lengths
+    first = np.where(lengths > 0, aln.matrix[:, 0] if aln.width else gap, gap)
+    last = np.where(lengths > 0, aln.matrix[rows, np.maximum(lengths - 1, 0)], gap)
+    adj_start = np.where(first != gap, ord("N"), gap).astype(np.uint8)
+    adj_end = np.where(last != gap, ord("N"), gap).astype(np.uint8)
+    new_lengths = lengths + shift
+    new_lengths = new_lengths + (3 - new_lengths % 3) % 3
+    width = int(new_lengths.max()) if len(aln) else 0
+    matrix = np.full((len(aln), width), gap, dtype=np.uint8)
+    matrix[:, :shift] = adj_start[:, None]
+    matrix[:, shift : shift + aln.width] = aln.matrix
+    columns = np.arange(width)
+    tail = (columns >= (lengths + shift)[:, None]) & (columns < new_lengths[:, None])
+    matrix[tail] = np.broadcast_to(adj_end[:, None], matrix.shape)[tail]
+    return Alignment(matrix, aln.ids, aln.descriptions, new_lengths, aln.path)
+
+
+def write_orf1_alignment(
+    in_file: Union[str, Alignment], out_file: str, best_orf: Optional[int] = None
+) -> None:
+    aln = read_alignment(in_file)
     if best_orf is None:
-        best_orf = get_best_orf(in_file)
-    orf1_aln = []
-    aln = SeqIO.parse(in_file, "fasta")
-    for seq in aln:
-        adj = get_adjustment_bases(seq.seq)
-        orf1_aln.append(set_to_orf1(seq, best_orf, adj))
+        best_orf = get_best_orf(aln)
+    set_matrix_to_orf1(aln, best_orf).write(out_file)
+
+
+def get_orf1_file(in_file: str) -> str:
     out_file = inject_grandparent_directory(in_file, "ORF1")
+    return inject_prefix_suffix(out_file, "ORF1_", "")
+
+
+def fix_dna_alignment(
+    in_file: Union[str, Alignment],
+    best_orf: Optional[int] = None,
+    cache: Optional[bool] = True,
+    write: Optional[bool] = True,
+) -> Union[str, Alignment]:
+    if not write:
+        aln = read_alignment(in_file)
+        if best_orf is None:
+            best_orf = get_best_orf(aln)
+        fixed = set_matrix_to_orf1(aln, best_orf)
+        fixed.path = get_orf1_file(aln.path) if aln.path else None
+        return fixed
+    if isinstance(in_file, Alignment):
+        # in-memory alignments may differ from their source file: not cached
+        out_file = get_orf1_file(in_file.path)
+        create_parent_directory(out_file)
+        write_orf1_alignment(in_file, out_file, best_orf)
+        return out_file
+    out_file = get_orf1_file(in_file)
     create_parent_directory(out_file)
-    out_file = inject_prefix_suffix(out_file, "ORF1_", "")
-    SeqIO.write(orf1_aln, out_file, "fasta")
+    cached_call(
+        write_orf1_alignment,
+        [in_file],
+        [out_file],
+        in_file,
+        out_file,
+        best_orf,
+        cache=cache,
+    )
+    return out_file
 
 
 def get_adjustment_bases(seq: Seq) -> tuple[str, str]:
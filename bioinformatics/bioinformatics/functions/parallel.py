@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from functools import partial
+from typing import Any, Callable, Iterable, Optional
+from tqdm import tqdm
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory_mb() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024**2
+
+
+def resolve_jobs(jobs: Optional[int] = 1) -> int:
+    # jobs=None or 0 uses every core; negative values leave that many cores free
+    # (jobs=-1 -> all cores, jobs=-2 -> all but one), mirroring joblib
+    cores = available_cores()
+    if not jobs:
+        return cores
+    if jobs < 0:
+        return max(1, cores + 1 + jobs)
+    return min(jobs, cores)
+
+
+def split_core_budget(
+    jobs: Optional[int], task_count: int, tool_threads: bool = False
+) -> tuple[int, int]:
+    # returns (python workers, threads per external tool call); when there are
+    # fewer tasks than cores, the spare cores go to the tool's own threading
+    cores = resolve_jobs(jobs)
+    workers = max(1, min(cores, task_count))
+    threads = max(1, cores // workers) if tool_threads else 1
+    return (workers, threads)
+
+
+def run_parallel(
+    func: Callable[..., Any],
+    items: Iterable[Any],
+    jobs: Optional[int] = 1,
+    desc: Optional[str] = None,
+    raise_errors: bool = False,
+    **kwargs,
+) -> tuple[list[Any], dict[Any, BaseException]]:
+    # results are returned in the order of items regardless of completion order;
+    # a failing item is recorded in errors and the rest of the batch continues
+    items = list(items)
+    workers, _ = split_core_budget(jobs, len(items))
+    task = partial(func, **kwargs) if kwargs else func
+    results = [None] * len(items)
+    errors = {}
+    if workers == 1:
+        for idx, item in enumerate(tqdm(items, desc=desc)):
+            try:
+                results[idx] = task(item)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                errors[item] = e
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(task, item): idx for idx, item in enumerate(items)
+            }
+            for future in tqdm(as_completed(futures), total=len(items), desc=desc):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    errors[items[idx]] = e
+    report_errors(errors)
+    return (results, errors)
+
+
+def run_budgeted(
+    func: Callable[..., Any],
+    items: Iterable[Any],
+    demands: list[tuple[int, int]],
+    cores: Optional[int] = None,
+    memory_mb: Optional[int] = None,
+    desc: Optional[str] = None,
+    **kwargs,
+) -> tuple[list[Any], dict[Any, BaseException]]:
+    # packs external tool runs under a shared core and memory budget: demands
+    # holds (threads, memory_mb) per item, and func(item, threads=..,
+    # memory_mb=.., **kwargs) is started largest first as soon as its demand fits
+    # in what is left, so small runs fill the gaps around large ones. A demand
+    # larger than the budget is capped to it and runs alone
+    items = list(items)
+    cores = resolve_jobs(cores)
+    if memory_mb is None:
+        memory_mb = available_memory_mb()
+    demands = [(min(max(1, t), cores), min(max(0, m), memory_mb)) for t, m in demands]
+    pending = sorted(range(len(items)), key=lambda i: demands[i], reverse=True)
+    free_cores, free_memory = cores, memory_mb
+    results = [None] * len(items)
+    errors = {}
+    with ThreadPoolExecutor(max_workers=cores) as executor, tqdm(
+        total=len(items), desc=desc
+    ) as progress:
+        running = {}
+        while pending or running:
+            for idx in list(pending):
+                threads, memory = demands[idx]
+                if threads <= free_cores and memory <= free_memory:
+                    pending.remove(idx)
+                    free_cores -= threads
+                    free_memory -= memory
+                    future = executor.submit(
+                        func, items[idx], threads=threads, memory_mb=memory, **kwargs
+                    )
+                    running[future] = idx
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = running.pop(future)
+                free_cores += demands[idx][0]
+                free_memory += demands[idx][1]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    errors[items[idx]] = e
+                progress.update()
+    report_errors(errors)
+    return (results, errors)
+
+
+def report_errors(errors: dict[Any, BaseException]) -> None:
+    if errors:
+        print(f"{len(errors)} item(s) failed:")
+        for item, error in errors.items():
+            print(f"  {item}: {type(error).__name__}: {error}")
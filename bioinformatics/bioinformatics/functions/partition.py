@@ -1,15 +1,23 @@
-# def partition_codon_position()
 # def partition_probe_flank()  # will require a function to get probe and flank (see Breinholt code)
-from typing import Optional
+import os
+from typing import Optional, Union
+import numpy as np
 from bioinformatics.functions.file_utils import (
     create_parent_directory,
     generate_process,
+    inject_parent_directory,
+    inject_prefix_suffix,
     list_files,
+    replace_suffix,
+    suffix_parser,
 )
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.functions.parallel import run_parallel
+from bioinformatics.models.alignment import Alignment
 
 
 def amas_create_supermatrix(
-    input_folder: str,
+    input_folder: Union[str, list[str]],
     partition_outfile: str,
     supermatrix_outfile: str,
     input_format: Optional[str] = "fasta",
@@ -53,5 +61,343 @@ def amas_create_supermatrix(
             "-i",
         ]
     )
-    cmd.extend(list_files(input_folder))
-    generate_process(cmd, stdout=True)
+    if isinstance(input_folder, str):
+        in_files = list_files(input_folder)
+    else:
+        in_files = list(input_folder)
+    cmd.extend(in_files)
+    generate_process(cmd, stdout=True, input_files=in_files)
+
+
+def get_locus_name(in_file: str) -> str:
+    return os.path.basename(in_file).split(".")[0]
+
+
+def scan_locus(
+    in_file: str, input_format: Optional[str] = "fasta"
+) -> tuple[list[str], int]:
+    aln = read_alignment(in_file, input_format)
+    if not aln.is_aligned():
+        raise ValueError(f"{in_file}: sequences must all be the same length")
+    if len(set(aln.ids)) != len(aln.ids):
+        raise ValueError(f"{in_file}: duplicate sequence labels")
+    return (list(aln.ids), aln.width)
+
+
+def get_supermatrix_layout(
+    taxa: list[str],
+    site_count: int,
+    supermatrix_format: Optional[str] = "phylip",
+    input_datatype: Optional[str] = "dna",
+    missing_char: Optional[str] = "?",
+) -> tuple[str, list[str], str]:
+    # (header, per-taxon prefix written before each sequence, footer); every
+    # sequence is site_count characters followed by a newline
+    name_width = max(len(x) for x in taxa)
+    if supermatrix_format == "phylip":
+        header = f"{len(taxa)} {site_count}\n"
+        prefixes = [f"{x.ljust(name_width)} " for x in taxa]
+        footer = ""
+    elif supermatrix_format == "fasta":
+        header = ""
+        prefixes = [f">{x}\n" for x in taxa]
+        footer = ""
+    elif supermatrix_format == "nexus":
+        datatype = "PROTEIN" if input_datatype == "aa" else "DNA"
+        header = (
+            "#NEXUS\n\nBEGIN DATA;\n"
+            f"\tDIMENSIONS NTAX={len(taxa)} NCHAR={site_count};\n"
+            f"\tFORMAT DATATYPE={datatype} GAP=- MISSING={missing_char};\n"
+            "\tMATRIX\n"
+        )
+        prefixes = [f"\t{x.ljust(name_width)} " for x in taxa]
+        footer = "\t;\nEND;\n"
+    else:
+        raise ValueError(f"Unsupported supermatrix format: {supermatrix_format}")
+    return (header, prefixes, footer)
+
+
+def get_recode_table(recode: Optional[dict[str, str]] = None) -> np.ndarray:
+    table = np.arange(256, dtype=np.uint8)
+    for search_char, replace_char in (recode or {}).items():
+        table[ord(search_char)] = ord(replace_char)
+    return table
+
+
+def write_locus_block(
+    locus: tuple[str, int],
+    supermatrix_outfile: str,
+    taxa_rows: dict[str, int],
+    seq_offsets: np.ndarray,
+    input_format: Optional[str] = "fasta",
+    missing_char: Optional[str] = "?",
+    recode_table: Optional[np.ndarray] = None,
+) -> None:
+    # each locus owns a disjoint column range of the preallocated matrix, so
+    # workers write straight into the shared mapping without coordination
+    in_file, locus_start = locus
+    aln = read_alignment(in_file, input_format)
+    if recode_table is None:
+        recode_table = get_recode_table()
+    block = np.full(
+        (len(seq_offsets), aln.width), recode_table[ord(missing_char)], dtype=np.uint8
+    )
+    block[[taxa_rows[x] for x in aln.ids]] = recode_table[aln.matrix]
+    supermatrix = np.memmap(supermatrix_outfile, dtype=np.uint8, mode="r+")
+    supermatrix[seq_offsets[:, None] + locus_start + np.arange(aln.width)] = block
+    supermatrix.flush()
+    del supermatrix
+
+
+def get_codon_charsets(
+    locus_name: str, start: int, end: int, codons: Optional[str] = "none"
+) -> list[tuple[str, list[str]]]:
+    # 1-based inclusive coordinates
+    if codons == "123":
+        return [
+            (f"{locus_name}_pos{i}", [f"{start + i - 1}-{end}\\3"]) for i in range(1, 4)
+        ]
+    if codons == "12":
+        return [
+            (f"{locus_name}_pos12", [f"{start}-{end}\\3", f"{start + 1}-{end}\\3"]),
+            (f"{locus_name}_pos3", [f"{start + 2}-{end}\\3"]),
+        ]
+    return [(locus_name, [f"{start}-{end}"])]
+
+
+def write_partition_file(
+    charsets: list[tuple[str, list[str]]],
+    partition_outfile: str,
+    partition_format: Optional[str] = "nexus",
+    input_datatype: Optional[str] = "dna",
+) -> None:
+    create_parent_directory(partition_outfile)
+    with open(partition_outfile, "w") as f:
+        if partition_format == "nexus":
+            f.write("#NEXUS\n\nBegin sets;\n")
+            for name, ranges in charsets:
+                f.write(f"\tcharset {name} = {' '.join(ranges)};\n")
+            f.write("end;\n")
+        elif partition_format == "raxml":
+            model = "WAG" if input_datatype == "aa" else "DNA"
+            for name, ranges in charsets:
+                f.write(f"{model}, {name} = {', '.join(ranges)}\n")
+        else:
+            raise ValueError(f"Unsupported partition format: {partition_format}")
+
+
+def read_partition_file(partition_file: str) -> list[tuple[str, list[str]]]:
+    # reads back the nexus and raxml charsets written by write_partition_file
+    charsets = []
+    with open(partition_file) as f:
+        for line in f:
+            line = line.strip().rstrip(";")
+            if line.lower().startswith("charset "):
+                name, ranges = line[len("charset ") :].split("=", 1)
+                charsets.append((name.strip(), ranges.split()))
+            elif "=" in line and "," in line.split("=", 1)[0]:
+                name, ranges = line.split(",", 1)[1].split("=", 1)
+                charsets.append((name.strip(), [x.strip() for x in ranges.split(",")]))
+    return charsets
+
+
+def get_charset_columns(ranges: list[str]) -> np.ndarray:
+    # 1-based "start-end" or "start-end\step" ranges to sorted 0-based columns
+    columns = []
+    for charset_range in ranges:
+        span, _, step = charset_range.partition("\\")
+        start, _, end = span.partition("-")
+        columns.append(np.arange(int(start) - 1, int(end or start), int(step or 1)))
+    return np.unique(np.concatenate(columns)) if columns else np.array([], int)
+
+
+def create_supermatrix(
+    input_folder: Union[str, list[str]],
+    partition_outfile: str,
+    supermatrix_outfile: str,
+    input_format: Optional[str] = "fasta",
+    input_datatype: Optional[str] = "dna",
+    supermatrix_format: Optional[str] = "phylip",
+    partition_format: Optional[str] = "nexus",
+    codons: Optional[str] = "none",
+    missing_char: Optional[str] = "?",
+    recode: Optional[dict[str, str]] = None,
+    jobs: Optional[int] = 1,
+) -> None:
+    # in-process alternative to amas_create_supermatrix: a first parallel pass
+    # collects labels and lengths, the output is preallocated, then every locus
+    # is parsed again and written into its own columns. Taxa missing from a
+    # locus are filled with missing_char and recode (e.g. {"?": "N"}) is applied
+    # while writing, so only one locus per worker is ever held in memory
+    if isinstance(input_folder, str):
+        in_files = sorted(list_files(input_folder))
+    else:
+        in_files = list(input_folder)
+    if not in_files:
+        raise ValueError("No loci to concatenate")
+    summaries, _ = run_parallel(
+        scan_locus, in_files, jobs=jobs, raise_errors=True, input_format=input_format
+    )
+    taxa = sorted({x for ids, _ in summaries for x in ids})
+    taxa_rows = {x: i for i, x in enumerate(taxa)}
+    locus_starts = np.concatenate([[0], np.cumsum([x[1] for x in summaries])])
+    site_count = int(locus_starts[-1])
+
+    recode_table = get_recode_table(recode)
+    header, prefixes, footer = get_supermatrix_layout(
+        taxa,
+        site_count,
+        supermatrix_format,
+        input_datatype,
+        chr(recode_table[ord(missing_char)]),
+    )
+    seq_offsets = np.zeros(len(taxa), dtype=np.int64)
+    position = len(header)
+    for idx, prefix in enumerate(prefixes):
+        seq_offsets[idx] = position + len(prefix)
+        position = seq_offsets[idx] + site_count + 1
+    create_parent_directory(supermatrix_outfile)
+    supermatrix = np.memmap(
+        supermatrix_outfile, dtype=np.uint8, mode="w+", shape=(position + len(footer),)
+    )
+    supermatrix[: len(header)] = np.frombuffer(header.encode(), dtype=np.uint8)
+    for offset, prefix in zip(seq_offsets, prefixes):
+        supermatrix[offset - len(prefix) : offset] = np.frombuffer(
+            prefix.encode(), dtype=np.uint8
+        )
+        supermatrix[offset + site_count] = ord("\n")
+    supermatrix[position:] = np.frombuffer(footer.encode(), dtype=np.uint8)
+    supermatrix.flush()
+    del supermatrix
+
+    run_parallel(
+        write_locus_block,
+        list(zip(in_files, locus_starts[:-1].tolist())),
+        jobs=jobs,
+        raise_errors=True,
+        supermatrix_outfile=supermatrix_outfile,
+        taxa_rows=taxa_rows,
+        seq_offsets=seq_offsets,
+        input_format=input_format,
+        missing_char=missing_char,
+        recode_table=recode_table,
+    )
+    charsets = []
+    for in_file, start, (_, width) in zip(in_files, locus_starts, summaries):
+        charsets.extend(
+            get_codon_charsets(
+                get_locus_name(in_file), start + 1, start + width, codons
+            )
+        )
+    write_partition_file(charsets, partition_outfile, partition_format, input_datatype)
+
+
+# codon positions (0-based within a codon) kept by each split
+codon_position_sets = {
+    "nt1": (0,),
+    "nt2": (1,),
+    "nt3": (2,),
+    "nt12": (0, 1),
+    "nt123": (0, 1, 2),
+}
+
+
+def get_codon_position_view(matrix: np.ndarray, name: str) -> np.ndarray:
+    # (taxa, codons, positions) strided view of an ORF1 matrix; nothing is copied
+    if matrix.shape[1] % 3:
+        raise ValueError("Alignment is not a whole number of codons; run ORF1 first")
+    positions = codon_position_sets[name]
+    codons = matrix.reshape(matrix.shape[0], -1, 3)
+    return codons[:, :, positions[0] : positions[-1] + 1]
+
+
+def get_codon_position_file(in_file: str, name: str) -> str:
+    return inject_parent_directory(in_file, f"codon_positions/{name}")
+
+
+def get_codon_position_partition_file(
+    out_file: str, partition_format: Optional[str] = "nexus"
+) -> str:
+    out_file = inject_prefix_suffix(out_file, "", "_partitions")
+    return replace_suffix(out_file, "nex" if partition_format == "nexus" else "txt")
+
+
+def get_codon_position_charsets(
+    locus_name: str, name: str, codon_count: int
+) -> list[tuple[str, list[str]]]:
+    # charsets over the split matrix itself, one per codon position it holds
+    positions = codon_position_sets[name]
+    if len(positions) == 1:
+        return [(f"{locus_name}_pos{positions[0] + 1}", [f"1-{codon_count}"])]
+    width = codon_count * len(positions)
+    return [
+        (f"{locus_name}_pos{x + 1}", [f"{i + 1}-{width}\\{len(positions)}"])
+        for i, x in enumerate(positions)
+    ]
+
+
+def write_codon_position_matrix(
+    aln: Alignment, view: np.ndarray, out_file: str, output_format: str
+) -> None:
+    # every row is copied straight from the strided view into its place in the
+    # memory-mapped output file
+    width = view.shape[1] * view.shape[2]
+    header, prefixes, footer = get_supermatrix_layout(
+        list(aln.ids), width, output_format
+    )
+    create_parent_directory(out_file)
+    size = len(header) + sum(len(x) + width + 1 for x in prefixes) + len(footer)
+    out = np.memmap(out_file, dtype=np.uint8, mode="w+", shape=(size,))
+    out[: len(header)] = np.frombuffer(header.encode(), dtype=np.uint8)
+    position = len(header)
+    for idx, prefix in enumerate(prefixes):
+        out[position : position + len(prefix)] = np.frombuffer(
+            prefix.encode(), dtype=np.uint8
+        )
+        position += len(prefix)
+        out[position : position + width].reshape(view.shape[1:])[:] = view[idx]
+        position += width
+        out[position] = ord("\n")
+        position += 1
+    out[position:] = np.frombuffer(footer.encode(), dtype=np.uint8)
+    out.flush()
+    del out
+
+
+def partition_codon_position(
+    in_file: Union[str, Alignment],
+    positions: Optional[list[str]] = ["nt1", "nt2", "nt3", "nt12"],
+    partition_format: Optional[str] = "nexus",
+) -> dict[str, str]:
+    # in_file = 'bioinformatics/output/alignments/muscle3/LEP1/ORF1/ORF1_L1.fasta'
+    # splits an ORF1 alignment into one matrix per codon position set, each with
+    # a partition file of its codon positions; returns the matrix files by name
+    aln = read_alignment(in_file)
+    output_format = suffix_parser(aln.path)
+    if output_format not in ["phylip", "fasta", "nexus"]:
+        output_format = "fasta"
+    out_files = {}
+    for name in positions:
+        view = get_codon_position_view(aln.matrix, name)
+        out_file = get_codon_position_file(aln.path, name)
+        write_codon_position_matrix(aln, view, out_file, output_format)
+        write_partition_file(
+            get_codon_position_charsets(get_locus_name(aln.path), name, view.shape[1]),
+            get_codon_position_partition_file(out_file, partition_format),
+            partition_format,
+        )
+        out_files[name] = out_file
+    return out_files
+
+
+def partition_codon_positions(
+    input_folder: str, jobs: Optional[int] = 1, **kwargs
+) -> list[dict[str, str]]:
+    # only files directly in input_folder, so earlier splits are not re-split
+    in_files = sorted(
+        os.path.join(input_folder, x)
+        for x in os.listdir(input_folder)
+        if os.path.isfile(os.path.join(input_folder, x))
+    )
+    out_files, _ = run_parallel(partition_codon_position, in_files, jobs=jobs, **kwargs)
+    return out_files
@@ -1,13 +1,17 @@
 import csv
+import mmap
 import random
 import re
+from functools import lru_cache
 from os import path
 import pandas as pd
-from typing import Optional
+from typing import BinaryIO, Iterator, Optional
 from bioinformatics.functions.file_utils import (
     inject_prefix_suffix,
     create_parent_directory,
 )
+from bioinformatics.functions.matcher import compile_label_filter, label_matches
+from bioinformatics.models.alignment import PhylipIndex
 
 
 def form_regex(
@@ -25,26 +29,79 @@ def form_regex(
     return regex
 
 
-def read_new_tips(
+# a tip label directly follows "(" or "," and is either quoted or runs up to
+# the next Newick delimiter
+tip_label_pattern = re.compile(r"([(,]\s*)('(?:[^']|'')*'|[^\s:,();\[\]]+)")
+
+
+@lru_cache(maxsize=32)
+def load_new_tips(
     map_file: str,
+    modified: float,
     search_col_name: str,
     replace_col_name: str,
-    replace_chars: Optional[list[str]] = ["(", ")"],
+    replace_chars: tuple[str, ...],
 ) -> dict[str, str]:
-    regex = form_regex(replace_chars)
+    # modified (the map file's mtime) invalidates the cache when the file changes
+    regex = form_regex(list(replace_chars))
     df = pd.read_csv(map_file)
     if not df[f"{search_col_name}"].is_unique:
         raise ValueError("Search Column Contains Non-Unique Labels!")
     name_maps = dict(
         zip(
             # df[f"{search_col_name}"].str.replace(r"\.", "_", regex=True),
-            df[f"{search_col_name}"],
+            df[f"{search_col_name}"].astype(str),
             df[f"{replace_col_name}"].str.replace(rf"{regex}", "_", regex=True),
         )
     )
     return name_maps
 
 
+def read_new_tips(
+    map_file: str,
+    search_col_name: str,
+    replace_col_name: str,
+    replace_chars: Optional[list[str]] = ["(", ")"],
+) -> dict[str, str]:
+    # parsed once per map file and reused across every tree file relabelled with it
+    return load_new_tips(
+        map_file,
+        path.getmtime(map_file),
+        search_col_name,
+        replace_col_name,
+        tuple(replace_chars),
+    )
+
+
+def iter_newick_trees(
+    in_file: str, boot_tree_sep: str = ";", chunk_size: int = 1 << 20
+) -> Iterator[str]:
+    # yields one tree at a time (separator included), then any trailing text, so
+    # joining the output reproduces the file exactly
+    buffer = ""
+    with open(in_file) as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            trees = (buffer + chunk).split(boot_tree_sep)
+            for tree in trees[:-1]:
+                yield tree + boot_tree_sep
+            buffer = trees[-1]
+    if buffer:
+        yield buffer
+
+
+def relabel_newick(tree: str, name_maps: dict[str, str]) -> str:
+    # whole labels are looked up, so a name that is a prefix of another is safe
+    def relabel(match: re.Match) -> str:
+        label = match.group(2)
+        if label in name_maps:
+            return match.group(1) + name_maps[label]
+        if label[0] == "'" and label[1:-1].replace("''", "'") in name_maps:
+            return match.group(1) + name_maps[label[1:-1].replace("''", "'")]
+        return match.group(0)
+
+    return tip_label_pattern.sub(relabel, tree)
+
+
 def replace_tips(
     in_file: str,
     map_file: str,
@@ -57,27 +114,81 @@ def replace_tips(
     # replace_col_name = 'Species.nameNEW'
     # replace_tips(in_file, map_file, search_col_name, replace_col_name)
     name_maps = read_new_tips(map_file, f"{search_col_name}", f"{replace_col_name}")
-    tree = open(in_file, "r").read()
-    # tree = re.sub(
-    #     rf"({'|'.join(name_maps.keys())})", lambda m: rf"{name_maps[m.group(1)]}", tree
-    # )
-    for k, v in name_maps.items():
-        tree = tree.replace(k, v)
     out_file = inject_prefix_suffix(in_file, "", "_new_tips")
     create_parent_directory(out_file)
     with open(out_file, "w") as f:
-        f.write(tree)
+        for tree in iter_newick_trees(in_file):
+            f.write(relabel_newick(tree, name_maps))
+
+
+def index_phylip(in_file: str) -> PhylipIndex:
+    # single pass over the memory-mapped file keeping only row offsets, so memory
+    # use does not grow with the number of sites
+    rows = {}
+    with open(in_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        end = mm.find(b"\n")
+        if end == -1:
+            end = len(mm)
+        taxa_count, site_count = (int(x) for x in mm[:end].split()[:2])
+        start = end + 1
+        while start < len(mm):
+            end = mm.find(b"\n", start)
+            end = len(mm) if end == -1 else end + 1
+            name_end = mm.find(b" ", start, end)
+            if name_end > start:
+                rows[mm[start:name_end].decode()] = (start, end)
+            start = end
+    return PhylipIndex(taxa_count, site_count, rows)
 
 
 def get_taxa(in_file: str) -> list[str]:
-    taxa = []
-    with open(in_file) as f:
-        lines = f.readlines()[1:]
-        for line in lines:
-            taxon = re.search(r"^[^ ]* ", line)
-            if taxon:
-                taxa.append(taxon.group(0))
-    return taxa
+    return list(index_phylip(in_file).rows)
+
+
+def read_phylip_row(
+    in_file: str, taxon: str, index: Optional[PhylipIndex] = None
+) -> str:
+    if not index:
+        index = index_phylip(in_file)
+    start, end = index.rows[taxon]
+    with open(in_file, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode().split(" ", 1)[1].strip()
+
+
+def copy_byte_range(
+    f_in: BinaryIO, f_out: BinaryIO, start: int, end: int, chunk_size: int = 1 << 20
+) -> bytes:
+    # returns the last byte copied
+    f_in.seek(start)
+    last = b""
+    while start < end:
+        chunk = f_in.read(min(chunk_size, end - start))
+        if not chunk:
+            break
+        f_out.write(chunk)
+        last = chunk[-1:]
+        start += len(chunk)
+    return last
+
+
+def write_phylip_rows(
+    in_file: str,
+    out_file: str,
+    taxa: list[str],
+    index: Optional[PhylipIndex] = None,
+) -> None:
+    # rows are copied as raw byte ranges in the order given
+    if not index:
+        index = index_phylip(in_file)
+    create_parent_directory(out_file)
+    with open(in_file, "rb") as f_in, open(out_file, "wb") as f_out:
+        f_out.write(f" {len(taxa)} {index.site_count}\n".encode())
+        for taxon in taxa:
+            if copy_byte_range(f_in, f_out, *index.rows[taxon]) != b"\n":
+                f_out.write(b"\n")
 
 
 def get_taxa_from_phylo(in_file: str) -> Optional[list[str]]:
@@ -142,9 +253,6 @@ def get_site_count(in_file: str) -> int:
             return int(first_line[1])
 
 
-special_chars = ["[", "]", "(", ")", "{", "}", "*", "+", "?", "|", "^", "$", ".", "\\"]
-
-
 def drop_taxa(
     input_file: str,
     final_taxa_count: int,
@@ -152,8 +260,8 @@ def drop_taxa(
     taxa_to_retain: Optional[list[str]] = [],
     taxa_to_remove: Optional[list[str]] = [],
 ) -> None:
-    # get taxa
-    taxa = get_taxa(input_file)
+    index = index_phylip(input_file)
+    taxa = list(index.rows)
     assert (
         len(taxa) >= final_taxa_count
     ), "Desired final alignment size is larger than current alignment size."
@@ -178,45 +286,25 @@ def drop_taxa(
     assert (
         random_sample <= drop_pool
     ), "Cannot drop/retain that many taxa and meet desired final alignment size."
-    with open(input_file) as f:
-        lines = f.readlines()[1:]
-        retained_lines = []
-        # retain taxa to retain
-        if taxa_to_retain:
-            taxa_to_retain_clean = [
-                "".join([f"\{y}" if y in special_chars else y for y in x])
-                for x in taxa_to_retain
-            ]
-            retain_regex = "|".join(taxa_to_retain_clean)
-            _ = [
-                retained_lines.append(line)
-                for line in lines
-                if re.search(rf"{retain_regex}", line)
-            ]
-        # drop taxa to remove
-        if taxa_to_remove:
-            taxa_to_remove_clean = [
-                "".join([f"\{y}" if y in special_chars else y for y in x])
-                for x in taxa_to_remove
-            ]
-            remove_regex = "|".join(taxa_to_remove_clean)
-            if taxa_to_retain:
-                remove_regex = remove_regex + "|" + retain_regex
-            new_lines = [
-                line for line in lines if not re.search(rf"{remove_regex}", line)
-            ]
-        elif taxa_to_retain:
-            new_lines = [
-                line for line in lines if not re.search(rf"{retain_regex}", line)
-            ]
-        else:
-            new_lines = lines
-        # randomly sample lines from pool
-        if random_sample > 0:
-            lines_out = random.sample(new_lines, random_sample)
-            retained_lines = retained_lines + lines_out
-        create_parent_directory(output_file)
-        with open(output_file, "w") as f_out:
-            f_out.write(f" {final_taxa_count} {str(get_site_count(input_file))}\n")
-            for line in retained_lines:
-                f_out.write(line)
+    # retain taxa to retain
+    retained_taxa = []
+    if taxa_to_retain:
+        retain_matcher = compile_label_filter(taxa_to_retain)
+        retained_taxa = [x for x in taxa if label_matches(retain_matcher, x)]
+    retained_set = set(retained_taxa)  # the list keeps the output order
+    # drop taxa to remove
+    if taxa_to_remove:
+        remove_matcher = compile_label_filter(taxa_to_remove)
+        new_taxa = [
+            x
+            for x in taxa
+            if not label_matches(remove_matcher, x) and x not in retained_set
+        ]
+    elif taxa_to_retain:
+        new_taxa = [x for x in taxa if x not in retained_set]
+    else:
+        new_taxa = taxa
+    # randomly sample rows from pool
+    if random_sample > 0:
+        retained_taxa = retained_taxa + random.sample(new_taxa, random_sample)
+    write_phylip_rows(input_file, output_file, retained_taxa, index)
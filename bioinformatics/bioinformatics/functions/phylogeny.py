@@ -1,11 +1,20 @@
+import csv
+import math
+import os
+import shutil
+import tempfile
 from typing import Optional
+import numpy as np
 from bioinformatics.models.phylogeny import PhyloSoftware
 
 
 from bioinformatics.functions.file_utils import (
     generate_process,
     create_parent_directory,
+    suffix_parser,
 )
+from bioinformatics.functions.cache import cached_process
+from bioinformatics.functions.ingest import read_alignment
 
 
 def infer_phylogeny(
@@ -13,11 +22,15 @@ def infer_phylogeny(
     builder: PhyloSoftware,
     partition_file: Optional[str] = None,
     stdout: bool = False,
+    cache: Optional[bool] = True,
+    threads: Optional[int] = None,
+    memory_mb: Optional[int] = None,
 ) -> None:
     # alignment = 'bioinformatics/input/test_files/example.phy'
     # builder = PhyloSoftware("iqtree2")
     # partition_file = 'bioinformatics/input/test_files/example.nex'
     cmd = []
+    out_prefix = alignment
     if builder.name == "iqtree2":
         src = "bioinformatics/src/phylogenetics/iqtree2_v2.2.0"
         in_param = "-s"
@@ -25,7 +38,10 @@ def infer_phylogeny(
         if partition_file:
             partition_param = "-p"
             cmd.extend([partition_param, partition_file])
-        cmd.extend(["-T", "6"])
+            out_prefix = partition_file  # IQ-TREE names outputs after -p
+        cmd.extend(["-T", str(threads or 6)])
+        if memory_mb:
+            cmd.extend(["-mem", f"{memory_mb}M"])
         cmd.extend(["-m", "MFP"])
         # cmd.extend(["-mset", "JC,F81,HKY,TIM,GTR"])
     elif builder.name == "raxmlng":
@@ -39,10 +55,105 @@ def infer_phylogeny(
             partition_param = "--model"
             partition_file = "GTR+G"
             cmd.extend([partition_param, partition_file])
+        if threads:
+            cmd.extend(["--threads", str(threads)])
     else:
         raise Exception("Phylogeny software choice not understood.")
     print(cmd)
-    generate_process(cmd, stdout=True)
+    cached_process(
+        cmd,
+        [alignment, partition_file],
+        out_prefix=out_prefix,
+        stdout=True,
+        cache=cache,
+    )
+
+
+def get_alignment_dimensions(alignment: str) -> tuple[int, int]:
+    # (taxa, sites); PHYLIP files only need their header line
+    if suffix_parser(alignment) == "phylip":
+        with open(alignment) as f:
+            ntaxa, nsites = f.readline().split()[:2]
+        return (int(ntaxa), int(nsites))
+    aln = read_alignment(alignment)
+    return (len(aln), aln.width)
+
+
+def load_resource_history(
+    results_file: Optional[
+        str
+    ] = "bioinformatics/output/benchmark/benchmark_results.csv",
+) -> list[tuple[int, int, int]]:
+    # (taxa, sites, peak RAM in MB) of past runs summarised by parse_log_files
+    history = []
+    if not os.path.exists(results_file):
+        return history
+    with open(results_file) as f:
+        for row in csv.DictReader(f):
+            ram = [
+                int(row[x]) for x in ["model_ram_used", "tree_ram_used"] if row.get(x)
+            ]
+            if ram and row.get("ntaxa") and row.get("nsites"):
+                history.append((int(row["ntaxa"]), int(row["nsites"]), max(ram)))
+    return history
+
+
+def fit_resource_history(history: list[tuple[int, int, int]]) -> tuple[float, float]:
+    # least-squares fit of peak RAM (MB) = overhead + per_cell * taxa * sites, so
+    # the fixed overhead that dominates small runs is not scaled up with the
+    # matrix; falls back to a line through the origin when the intercept comes
+    # out negative or there is only one matrix size to fit
+    cells = np.array([t * s for t, s, _ in history], dtype=float)
+    ram = np.array([r for _, _, r in history], dtype=float)
+    if len(np.unique(cells)) > 1:
+        per_cell, overhead = np.polyfit(cells, ram, 1)
+        if overhead >= 0 and per_cell > 0:
+            return (float(overhead), float(per_cell))
+    return (0.0, float(np.dot(cells, ram) / np.dot(cells, cells)))
+
+
+def estimate_phylogeny_resources(
+    alignment: str,
+    history: Optional[list[tuple[int, int, int]]] = None,
+    max_threads: Optional[int] = 64,
+    cells_per_thread: Optional[int] = 5_000_000,
+    memory_margin: Optional[float] = 1.25,
+) -> tuple[int, int]:
+    # returns (threads, memory_mb). Memory scales with the taxa x sites matrix:
+    # a fixed overhead plus per-cell cost fitted to past runs when there is
+    # history, otherwise the size of the partial likelihood vectors (2n nodes x
+    # sites x 4 states x 4 rate categories x 8 bytes). Threads follow the matrix
+    # size, as small alignments gain little from extra threads
+    ntaxa, nsites = get_alignment_dimensions(alignment)
+    cells = ntaxa * nsites
+    history = [x for x in history or [] if x[0] * x[1]]
+    if history:
+        overhead, per_cell = fit_resource_history(history)
+        memory_mb = overhead + cells * per_cell
+    else:
+        memory_mb = 2 * cells * 4 * 4 * 8 / 1024**2
+    threads = min(max_threads, max(1, math.ceil(cells / cells_per_thread)))
+    return (threads, max(256, math.ceil(memory_mb * memory_margin)))
+
+
+def get_random_tree_prefix(
+    ntaxa: int,
+    nsites: int,
+    process: Optional[str] = "bd",
+    output_folder: Optional[str] = "bioinformatics/input/benchmark/sim_data/",
+    birth_rate: Optional[float] = 0.1,
+    death_rate: Optional[float] = 0.05,
+    seed: Optional[int] = None,
+) -> str:
+    if process == "bd":
+        output = f"{output_folder}/benchmark_data_{process}_br_{birth_rate}_dr_{death_rate}_{ntaxa}_taxa_{nsites}_sites"
+    elif process in ["yh", "u", "cat", "bal"]:
+        output = f"{output_folder}/benchmark_data_{process}_{ntaxa}_taxa_{nsites}_sites"
+    else:
+        raise Exception(ValueError)
+    if seed is not None:
+        output = f"{output}_seed_{seed}"
+    return output
 
 
 def generate_random_tree(
@@ -53,38 +164,44 @@ def generate_random_tree(
     birth_rate: Optional[float] = 0.1,
     death_rate: Optional[float] = 0.05,
     stdout: Optional[bool] = False,
-):
+    seed: Optional[int] = None,
+) -> str:
     # more info and options: http://www.iqtree.org/doc/AliSim
+    # outputs are written to a hidden .partial_ directory and moved into place
+    # only once AliSim exits cleanly, so an existing .phy is always complete and
+    # is not regenerated; a failed run leaves nothing behind
+    output = get_random_tree_prefix(
+        ntaxa, nsites, process, output_folder, birth_rate, death_rate, seed
+    )
+    if os.path.exists(f"{output}.phy"):
+        return output
+    create_parent_directory(output)
+    folder = os.path.dirname(output) or "."
+    staging = tempfile.mkdtemp(prefix=".partial_", dir=folder)
+    partial = os.path.join(staging, os.path.basename(output))
     cmd = []
     src = "bioinformatics/src/phylogenetics/iqtree2_v2.2.0"
     cmd.extend(
         [
             src,
             "--alisim",
+            f"{partial}",
+            "-t",
         ]
     )
     if process == "bd":
-        output = f"{output_folder}/benchmark_data_{process}_br_{birth_rate}_dr_{death_rate}_{ntaxa}_taxa_{nsites}_sites"
-        create_parent_directory(output)
-        cmd.extend(
-            [
-                f"{output}",
-                "-t",
-                f"RANDOM{{{process}{{{birth_rate}/{death_rate}}}/{ntaxa}}}",
-            ]
-        )
-    elif process in ["yh", "u", "cat", "bal"]:
-        output = f"{output_folder}/benchmark_data_{process}_{ntaxa}_taxa_{nsites}_sites"
-        create_parent_directory(output)
-        cmd.extend(
-            [
-                f"{output}",
-                "-t",
-                f"RANDOM{{{process}/{ntaxa}}}",
-            ]
-        )
+        cmd.append(f"RANDOM{{{process}{{{birth_rate}/{death_rate}}}/{ntaxa}}}")
     else:
-        raise Exception(ValueError)
+        cmd.append(f"RANDOM{{{process}/{ntaxa}}}")
     cmd.extend(["--length", f"{nsites}"])
+    if seed is not None:
+        cmd.extend(["--seed", f"{seed}"])
 
-    generate_process(cmd, stdout=stdout)
+    try:
+        generate_process(cmd, stdout=stdout, input_files=[])
+        # the .phy goes last so it only appears once its companions are in place
+        for filename in sorted(os.listdir(staging), key=lambda x: x.endswith(".phy")):
+            os.replace(os.path.join(staging, filename), os.path.join(folder, filename))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return output
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, Optional
+from bioinformatics.functions.cache import hash_file
+from bioinformatics.functions.file_utils import create_parent_directory, list_files
+from bioinformatics.functions.ingest import read_alignment
+from bioinformatics.functions.parallel import report_errors, resolve_jobs
+
+
+class Stage(NamedTuple):
+    # per-file stages run func(in_file, **kwargs) once per locus and write
+    # output(in_file); aggregate stages run func(in_files, **kwargs) once over
+    # every upstream output and write output(in_files)
+    name: str
+    func: Callable[..., Any]
+    output: Callable[..., str]
+    depends: Optional[str] = None
+    kwargs: dict[str, Any] = {}
+    aggregate: bool = False
+
+
+def run_stage(func: Callable[..., Any], in_file: Any, kwargs: dict[str, Any]) -> Any:
+    return func(in_file, **kwargs)
+
+
+def stage_signature(stage: Stage, in_files: list[str]) -> str:
+    digest = hashlib.sha256(f"{stage.name}:{sorted(stage.kwargs.items())!r}".encode())
+    for in_file in in_files:
+        digest.update(hash_file(in_file).encode())
+    return digest.hexdigest()
+
+
+def load_pipeline_state(state_file: str) -> dict[str, str]:
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            return json.load(f)
+    return {}
+
+
+def save_pipeline_state(state: dict[str, str], state_file: str) -> None:
+    create_parent_directory(state_file)
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(state_file + ".tmp", state_file)
+
+
+def order_stages(stages: list[Stage]) -> list[Stage]:
+    names = {stage.name for stage in stages}
+    ordered = []
+    done = set()
+    pending = list(stages)
+    while pending:
+        ready = [x for x in pending if x.depends is None or x.depends in done]
+        if not ready:
+            missing = [x.name for x in pending if x.depends not in names]
+            raise ValueError(f"Stage dependencies cannot be resolved: {missing}")
+        for stage in ready:
+            if stage.aggregate and any(
+                x.depends == stage.name for x in stages if x is not stage
+            ):
+                raise ValueError(f"Aggregate stage {stage.name} cannot have children")
+            ordered.append(stage)
+            done.add(stage.name)
+            pending.remove(stage)
+    return ordered
+
+
+def run_pipeline(
+    stages: list[Stage],
+    input_folder: str,
+    jobs: Optional[int] = 1,
+    state_file: Optional[str] = "bioinformatics/output/.pipeline_state.json",
+    force: Optional[bool] = False,
+    recursive: Optional[bool] = False,
+) -> dict[str, BaseException]:
+    # every (stage, locus) pair is a node depending on the same locus in the
+    # upstream stage; a node re-runs only if its output is missing or the content
+    # of its input changed, so an edited locus re-runs only its own chain.
+    # independent nodes and branches run concurrently
+    stages = order_stages(stages)
+    children = {}
+    for stage in stages:
+        children.setdefault(stage.depends, []).append(stage)
+    state = {} if force else load_pipeline_state(state_file)
+    errors = {}
+    pending = {}  # aggregate stage name -> list of upstream outputs
+    waiting = {}  # aggregate stage name -> upstream nodes still to finish
+
+    def node_key(stage: Stage, in_file: Any) -> str:
+        if stage.aggregate:
+            return f"{stage.name}:*"
+        return f"{stage.name}:{in_file}"
+
+    def is_current(stage: Stage, in_files: list[str], out_file: str) -> bool:
+        key = node_key(stage, in_files if stage.aggregate else in_files[0])
+        if not os.path.exists(out_file) or key not in state:
+            return False
+        return state[key] == stage_signature(stage, in_files)
+
+    # stage outputs often land in subfolders of the input folder (e.g. padded/),
+    # so only top-level files are treated as loci unless asked otherwise
+    if recursive:
+        roots = sorted(list_files(input_folder))
+    else:
+        roots = sorted(
+            os.path.join(input_folder, x)
+            for x in os.listdir(input_folder)
+            if os.path.isfile(os.path.join(input_folder, x))
+        )
+    for stage in children.get(None, []):
+        if stage.aggregate:
+            waiting[stage.name] = 0
+            pending[stage.name] = list(roots)
+    for stage in stages:
+        if stage.aggregate and stage.depends is not None:
+            waiting[stage.name] = len(roots)
+            pending[stage.name] = []
+
+    with ProcessPoolExecutor(max_workers=resolve_jobs(jobs)) as executor:
+        running = {}
+
+        def schedule(stage: Stage, in_file: Any) -> None:
+            in_files = in_file if stage.aggregate else [in_file]
+            out_file = stage.output(in_file)
+            if is_current(stage, in_files, out_file):
+                finish(stage, in_file, out_file)
+            else:
+                # forget the old signature first: until this run succeeds, a
+                # leftover or truncated output must not count as current
+                state.pop(node_key(stage, in_file), None)
+                future = executor.submit(run_stage, stage.func, in_file, stage.kwargs)
+                running[future] = (stage, in_file, out_file)
+
+        def release(stage: Stage, out_file: Optional[str]) -> None:
+            for child in children.get(stage.name, []):
+                if child.aggregate:
+                    waiting[child.name] -= 1
+                    if out_file:
+                        pending[child.name].append(out_file)
+                    if waiting[child.name] == 0:
+                        if len(pending[child.name]) == len(roots):
+                            schedule(child, sorted(pending[child.name]))
+                        else:
+                            errors[child.name] = RuntimeError(
+                                "Skipped: upstream loci failed"
+                            )
+                elif out_file:
+                    schedule(child, out_file)
+                else:
+                    release(child, None)
+
+        def finish(stage: Stage, in_file: Any, out_file: str) -> None:
+            in_files = in_file if stage.aggregate else [in_file]
+            if os.path.exists(out_file):
+                state[node_key(stage, in_file)] = stage_signature(stage, in_files)
+                release(stage, out_file)
+            else:
+                errors[node_key(stage, in_file)] = FileNotFoundError(out_file)
+                release(stage, None)
+
+        for stage in children.get(None, []):
+            if stage.aggregate:
+                if roots:
+                    schedule(stage, roots)
+            else:
+                for in_file in roots:
+                    schedule(stage, in_file)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, in_file, out_file = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    # failed tools raise (see generate_process), so no signature
+                    # is recorded for their output
+                    errors[node_key(stage, in_file)] = e
+                    release(stage, None)
+                else:
+                    finish(stage, in_file, out_file)
+            save_pipeline_state(state, state_file)
+    save_pipeline_state(state, state_file)
+    report_errors(errors)
+    return errors
+
+
+class ChainStep(NamedTuple):
+    # func(aln, write=False, **kwargs) must return the transformed Alignment with
+    # its path set to the file it would have written; checkpoint writes it anyway
+    func: Callable[..., Any]
+    kwargs: dict[str, Any] = {}
+    checkpoint: bool = False
+
+    def __repr__(self) -> str:
+        # stable across runs so chain signatures stay comparable in the state file
+        name = f"{self.func.__module__}.{self.func.__qualname__}"
+        return f"ChainStep({name}, {sorted(self.kwargs.items())!r}, {self.checkpoint})"
+
+
+def run_chain(in_file: str, steps: list[ChainStep]) -> str:
+    # the alignment is read once and handed between steps in memory; only
+    # checkpoints and the final result are written
+    aln = read_alignment(in_file)
+    for count, step in enumerate(steps):
+        aln = step.func(aln, write=False, **step.kwargs)
+        if step.checkpoint or count == len(steps) - 1:
+            create_parent_directory(aln.path)
+            aln.write(aln.path)
+    return aln.path
+
+
+def chain_stage(
+    name: str,
+    steps: list[ChainStep],
+    output: Callable[..., str],
+    depends: Optional[str] = None,
+) -> Stage:
+    # output(in_file) must name the file the last step writes
+    return Stage(name, run_chain, output, depends, {"steps": steps})
@@ -0,0 +1,182 @@
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+import numpy as np
+from bioinformatics.functions.align import pad_alignment
+from bioinformatics.functions.consensus import generate_consensus
+from bioinformatics.functions.file_utils import create_parent_directory
+from bioinformatics.functions.gap import find_unique_gaps
+from bioinformatics.functions.ingest import filter_fasta_by_label
+from bioinformatics.functions.orf import get_best_orf
+from bioinformatics.functions.phylo_tips import drop_taxa
+from bioinformatics.functions.supports import rearrange_support
+
+# times and memory-profiles our own Python stages on synthetic data over a
+# taxa x sites grid. workdir must contain "/input/fasta/" because several stages
+# derive their output paths from it
+benchmark_workdir = "bioinformatics/output/benchmark/stages/input/fasta/synthetic"
+benchmark_results_file = "bioinformatics/output/benchmark/stage_results.json"
+benchmark_baseline_file = "bioinformatics/output/benchmark/stage_baseline.json"
+
+
+def get_synthetic_prefix(ntaxa: int, nsites: int, workdir: str) -> str:
+    return f"{workdir}/synthetic_{ntaxa}_taxa_{nsites}_sites"
+
+
+def generate_synthetic_data(
+    ntaxa: int,
+    nsites: int,
+    workdir: Optional[str] = benchmark_workdir,
+    gap_rate: Optional[float] = 0.05,
+    boot_trees: Optional[int] = 100,
+    seed: Optional[int] = 0,
+) -> dict[str, str]:
+    # one alignment written as FASTA and PHYLIP plus a file of bootstrap trees
+    # over the same taxa; returns the paths by format
+    rng = np.random.default_rng(seed)
+    matrix = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, (ntaxa, nsites))]
+    matrix = np.where(rng.random((ntaxa, nsites)) < gap_rate, ord("-"), matrix)
+    matrix = matrix.astype(np.uint8)
+    taxa = [f"taxon_{i}" for i in range(ntaxa)]
+    prefix = get_synthetic_prefix(ntaxa, nsites, workdir)
+    files = {
+        "fasta": prefix + ".fasta",
+        "phylip": prefix + ".phy",
+        "ufboot": prefix + ".ufboot",
+    }
+    create_parent_directory(prefix)
+    with open(files["fasta"], "wb") as f:
+        for taxon, row in zip(taxa, matrix):
+            f.write(f">{taxon}\n".encode() + row.tobytes() + b"\n")
+    with open(files["phylip"], "wb") as f:
+        f.write(f"{ntaxa} {nsites}\n".encode())
+        for taxon, row in zip(taxa, matrix):
+            f.write(f"{taxon} ".encode() + row.tobytes() + b"\n")
+    with open(files["ufboot"], "w") as f:
+        for _ in range(boot_trees):
+            order = rng.permutation(taxa).tolist()
+            tree = f"{order[0]}:0.1"
+            for taxon in order[1:]:
+                support = f"{rng.integers(0, 101)}/{rng.random():.2f}"
+                tree = f"({tree},{taxon}:0.1){support}:0.1"
+            f.write(f"({tree});\n")
+    return files
+
+
+def get_stage_benchmarks(ntaxa: int) -> dict[str, Callable[[dict[str, str]], Any]]:
+    # stage name -> call on the synthetic files
+    labels = [f"taxon_{i}" for i in range(0, ntaxa, 2)]
+    return {
+        "get_best_orf": lambda files: get_best_orf(files["fasta"]),
+        "generate_consensus": lambda files: generate_consensus(
+            files["fasta"], thresholds=[0.5, 0.75, 0.9]
+        ),
+        "find_unique_gaps": lambda files: find_unique_gaps(files["fasta"]),
+        "pad_alignment": lambda files: pad_alignment(files["fasta"]),
+        "filter_fasta_by_label": lambda files: filter_fasta_by_label(
+            files["fasta"], labels, ["taxon_1"]
+        ),
+        "drop_taxa": lambda files: drop_taxa(
+            files["phylip"],
+            max(1, ntaxa // 2),
+            files["phylip"].replace(".phy", "_sub.phy"),
+        ),
+        "rearrange_support": lambda files: rearrange_support(files["ufboot"], [2, 1]),
+    }
+
+
+def measure_stage(
+    func: Callable[[dict[str, str]], Any], files: dict[str, str], repeat: int = 3
+) -> dict[str, float]:
+    # best wall time over repeat runs, then peak Python heap in a separate traced
+    # run so tracing overhead does not distort the timing
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(files)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    func(files)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": min(timings),
+        "mean_seconds": sum(timings) / len(timings),
+        "peak_mb": peak / 1024**2,
+    }
+
+
+def run_stage_benchmarks(
+    ntaxa_grid: list[int],
+    nsites_grid: list[int],
+    stages: Optional[list[str]] = None,
+    repeat: Optional[int] = 3,
+    workdir: Optional[str] = benchmark_workdir,
+    results_file: Optional[str] = benchmark_results_file,
+) -> list[dict[str, Any]]:
+    results = []
+    for ntaxa in ntaxa_grid:
+        for nsites in nsites_grid:
+            files = generate_synthetic_data(ntaxa, nsites, workdir)
+            for name, func in get_stage_benchmarks(ntaxa).items():
+                if stages and name not in stages:
+                    continue
+                result = {"stage": name, "ntaxa": ntaxa, "nsites": nsites}
+                result.update(measure_stage(func, files, repeat))
+                results.append(result)
+                print(
+                    f"{name:<24}{ntaxa:>8} taxa{nsites:>10} sites"
+                    f"{result['seconds']:>10.4f} s{result['peak_mb']:>10.2f} MB"
+                )
+    create_parent_directory(results_file)
+    with open(results_file, "w") as f:
+        json.dump(
+            {
+                "platform": platform.platform(),
+                "python_version": platform.python_version(),
+                "results": results,
+            },
+            f,
+            indent=1,
+        )
+    return results
+
+
+def compare_stage_benchmarks(
+    results: list[dict[str, Any]],
+    baseline_file: Optional[str] = benchmark_baseline_file,
+    tolerance: Optional[float] = 0.2,
+    update_baseline: Optional[bool] = False,
+) -> list[dict[str, Any]]:
+    # returns the (stage, taxa, sites) points that are slower or use more memory
+    # than the baseline by more than tolerance; with no baseline stored yet (or
+    # update_baseline) the results become the new baseline
+    if update_baseline or not os.path.exists(baseline_file):
+        create_parent_directory(baseline_file)
+        with open(baseline_file, "w") as f:
+            json.dump({"results": results}, f, indent=1)
+        return []
+    with open(baseline_file) as f:
+        baseline = {
+            (x["stage"], x["ntaxa"], x["nsites"]): x for x in json.load(f)["results"]
+        }
+    regressions = []
+    for result in results:
+        reference = baseline.get((result["stage"], result["ntaxa"], result["nsites"]))
+        if not reference:
+            continue
+        time_ratio = result["seconds"] / max(reference["seconds"], 1e-9)
+        memory_ratio = result["peak_mb"] / max(reference["peak_mb"], 1e-9)
+        if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance:
+            regressions.append(
+                {**result, "time_ratio": time_ratio, "memory_ratio": memory_ratio}
+            )
+            print(
+                f"REGRESSION {result['stage']} {result['ntaxa']} taxa "
+                f"{result['nsites']} sites: time x{time_ratio:.2f}, "
+                f"memory x{memory_ratio:.2f}"
+            )
+    return regressions
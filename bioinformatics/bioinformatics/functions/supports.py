@@ -1,14 +1,40 @@
-import os
 import re
-from tqdm import tqdm
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Iterator, Optional
+from bioinformatics.functions.file_utils import list_files
+from bioinformatics.functions.parallel import resolve_jobs, run_parallel
+from bioinformatics.functions.phylo_tips import iter_newick_trees
 
 # input_folder = 'bioinformatics/input/test_files/supports'
 
 
-def rearrange_supports(input_folder: str, **kwargs) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            rearrange_support(os.path.join(root, filename), **kwargs)
+def rearrange_supports(input_folder: str, jobs: Optional[int] = 1, **kwargs) -> None:
+    run_parallel(
+        rearrange_support, sorted(list_files(input_folder)), jobs=jobs, **kwargs
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_support_pattern(bs_order: tuple[int, ...]) -> tuple[re.Pattern, str]:
+    search_string = "\)" + "([0-9|\.]+)\/" * (len(bs_order) - 1) + "([0-9|\.]+)\:"
+    replace_string = ")\\" + "/\\".join([str(x) for x in bs_order]) + ":"
+    return (re.compile(search_string), replace_string)
+
+
+def rearrange_tree_supports(trees: list[str], bs_order: tuple[int, ...]) -> str:
+    pattern, replace_string = compile_support_pattern(bs_order)
+    return "".join(pattern.sub(replace_string, tree) for tree in trees)
+
+
+def iter_tree_chunks(
+    in_file: str, boot_tree_sep: str = ";", chunk_size: int = 100
+) -> Iterator[list[str]]:
+    trees = iter_newick_trees(in_file, boot_tree_sep)
+    while chunk := list(islice(trees, chunk_size)):
+        yield chunk
 
 
 def rearrange_support(
@@ -17,36 +43,40 @@ def rearrange_support(
     output_prefix: str = "",
     output_suffix: str = "_output",
     boot_tree_sep: str = ";",
+    jobs: Optional[int] = 1,
+    chunk_size: int = 100,
 ) -> None:
     # in_file = 'bioinformatics/input/test_files/supports/L1.treefile'
     # in_file = 'bioinformatics/input/test_files/supports/L1.ufboot'
+    # trees are streamed in chunks of chunk_size; with jobs > 1 chunks are
+    # processed by worker processes and written back in input order, keeping at
+    # most two chunks per worker in flight
     if len(bs_order) not in [0, 1]:
-        search_string = "\)" + "([0-9|\.]+)\/" * (len(bs_order) - 1) + "([0-9|\.]+)\:"
-        replace_string = ")\\" + "/\\".join([str(x) for x in bs_order]) + ":"
+        bs_order = tuple(bs_order)
         filename = in_file.split(".")[0]
         filename = (
             "/".join(filename.split("/")[0:-1])
-            + '/' + output_prefix
+            + "/"
+            + output_prefix
             + filename.split("/")[-1]
         )
         suffix = in_file.split(".")[-1]
-        with open(in_file, "r") as f:  # read tree
-            contents = f.read()
-        output = []
-        if suffix in ["ufboot"]:
-            trees = contents.split(boot_tree_sep)
-        elif suffix in ["tre", "treefile"]:
-            trees = [contents]
-        for tree in trees:
-            if tree not in ["", "\n"]:
-                new_tree = re.sub(
-                    rf"{search_string}",
-                    rf"{replace_string}",
-                    tree,
-                )
-                output.append(new_tree)
-        output = f"{boot_tree_sep}".join(output)
+        chunks = iter_tree_chunks(in_file, boot_tree_sep, chunk_size)
+        workers = resolve_jobs(jobs)
         with open(filename + output_suffix + "." + suffix, "w") as f:  # write results
-            f.write(output)
+            if workers == 1:
+                for chunk in chunks:
+                    f.write(rearrange_tree_supports(chunk, bs_order))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(
+                            executor.submit(rearrange_tree_supports, chunk, bs_order)
+                        )
+                        if len(pending) >= 2 * workers:
+                            f.write(pending.popleft().result())
+                    while pending:
+                        f.write(pending.popleft().result())
     else:
         raise ValueError("2 or more branch supports per branch required.")
@@ -1,17 +1,20 @@
 import os
 import re
-from tqdm import tqdm
 from typing import List, Optional
 from bioinformatics.functions.ingest import (
     filter_fasta_by_label,
-    get_all_tips,
 )
 from bioinformatics.functions.blast import (
     create_blast_db,
     single_fasta_blast,
+    multi_fasta_blast,
     inject_blast_result,
 )
-from bioinformatics.functions.consensus import generate_consensus
+from bioinformatics.functions.matcher import compile_label_filter
+from bioinformatics.functions.consensus import (
+    generate_consensus,
+    combine_consensus_files,
+)
 from bioinformatics.functions.align import (
     pad_alignment,
     perform_alignment,
@@ -29,44 +32,73 @@ from bioinformatics.models.alignment import (
 from bioinformatics.models.trim import TrimSoftware
 from bioinformatics.functions.trim import trim_alignment
 from bioinformatics.functions.orf import fix_dna_alignment
-from bioinformatics.functions.file_utils import suffix_parser
+from bioinformatics.functions.gap import code_gaps
+from bioinformatics.functions.augment import create_augmented_alignments
+from bioinformatics.functions.file_utils import suffix_parser, list_files
+from bioinformatics.functions.occupancy import (
+    get_occupancy_index_file,
+    update_occupancy_index,
+)
+from bioinformatics.functions.parallel import run_parallel, split_core_budget
 
 
 def subset_fasta_alignments(
-    input_folder: str, primary_filter: List[str], secondary_filter: Optional[List[str]]
+    input_folder: str,
+    primary_filter: List[str],
+    secondary_filter: Optional[List[str]],
+    jobs: Optional[int] = 1,
+):
+    run_parallel(
+        filter_fasta_by_label,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        primary_filter=compile_label_filter(primary_filter),
+        secondary_filter=compile_label_filter(secondary_filter),
+    )
+
+
+def generate_consensus_seqs(
+    input_folder: str,
+    threshold: Optional[float] = 0.5,
+    jobs: Optional[int] = 1,
+    thresholds: Optional[List[float]] = None,
+    iupac: Optional[bool] = False,
+    gap_weight: Optional[float] = 0.0,
+    combined_file: Optional[str] = None,
 ):
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            filter_fasta_by_label(
-                fasta=os.path.join(root, filename),
-                primary_filter=primary_filter,
-                secondary_filter=secondary_filter,
-            )
-
-
-def generate_consensus_seqs(input_folder: str, threshold: Optional[float] = 0.5):
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            generate_consensus(fasta=os.path.join(root, filename), threshold=threshold)
-
-
-def get_all_tips_labels(input_folder: str, output_file: str):
-    tip_list_complete = []
-    for root, dirs, files in os.walk(input_folder):
-        for filename in files:
-            tip_list = get_all_tips(
-                fasta=os.path.join(root, filename), tip_list=tip_list_complete
-            )
-            tip_list_complete = list(set(tip_list + tip_list_complete))
+    # combined_file collects every locus consensus into one multi-FASTA, ready
+    # to be turned into a single BLAST database
+    consensus_files, _ = run_parallel(
+        generate_consensus,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        threshold=threshold,
+        thresholds=thresholds,
+        iupac=iupac,
+        gap_weight=gap_weight,
+    )
+    if combined_file:
+        combine_consensus_files([x for x in consensus_files if x], combined_file)
+
+
+def get_all_tips_labels(
+    input_folder: str,
+    output_file: str,
+    jobs: Optional[int] = 1,
+    index_file: Optional[str] = None,
+):
+    # labels come from the occupancy index, which only rescans new or changed loci
+    if not index_file:
+        index_file = get_occupancy_index_file(input_folder)
+    index = update_occupancy_index(input_folder, index_file, jobs=jobs)
+    tip_list_complete = set(index.taxa.tolist())
     os.makedirs("/".join(output_file.split("/")[0:-1]), exist_ok=True)
     with (open(output_file, "w")) as f:
-        f.write(f"{set(tip_list_complete)}")
+        f.write(f"{tip_list_complete}")
 
 
-def pad_alignments(input_folder: str) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            pad_alignment(os.path.join(root, filename))
+def pad_alignments(input_folder: str, jobs: Optional[int] = 1) -> None:
+    run_parallel(pad_alignment, sorted(list_files(input_folder)), jobs=jobs)
 
 
 def perform_alignments(
@@ -75,16 +107,20 @@ def perform_alignments(
     output_format: AlignmentOutputFormat,
     iterations: Optional[int] = None,
     stdout: bool = False,
+    jobs: Optional[int] = 1,
 ) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            perform_alignment(
-                os.path.join(root, filename),
-                aligner,
-                output_format,
-                iterations,
-                stdout,
-            )
+    in_files = sorted(list_files(input_folder))
+    _, threads = split_core_budget(jobs, len(in_files), tool_threads=True)
+    run_parallel(
+        perform_alignment,
+        in_files,
+        jobs=jobs,
+        aligner=aligner,
+        output_format=output_format,
+        iterations=iterations,
+        stdout=stdout,
+        threads=threads,
+    )
 
 
 def trim_alignments(
@@ -92,51 +128,202 @@ def trim_alignments(
     trimmer: TrimSoftware,
     method: Optional[str] = None,
     stdout: bool = False,
+    jobs: Optional[int] = 1,
 ) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            trim_alignment(os.path.join(root, filename), trimmer, method, stdout)
+    run_parallel(
+        trim_alignment,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        trimmer=trimmer,
+        method=method,
+        stdout=stdout,
+    )
 
 
-def fix_dna_alignments(input_folder: str, best_orf: Optional[int] = None) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            fix_dna_alignment(os.path.join(root, filename), best_orf)
+def fix_dna_alignments(
+    input_folder: str, best_orf: Optional[int] = None, jobs: Optional[int] = 1
+) -> None:
+    run_parallel(
+        fix_dna_alignment,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        best_orf=best_orf,
+    )
+
+
+def augment_alignments(
+    input_folder: str,
+    alignments: Optional[list[str]] = ["aa", "nt12", "nt12_degen"],
+    jobs: Optional[int] = 1,
+) -> None:
+    # only files directly in input_folder: the outputs land in subfolders of it
+    in_files = sorted(
+        os.path.join(input_folder, x)
+        for x in os.listdir(input_folder)
+        if os.path.isfile(os.path.join(input_folder, x))
+    )
+    run_parallel(
+        create_augmented_alignments,
+        in_files,
+        jobs=jobs,
+        alignments=alignments,
+    )
+
+
+def code_alignment_gaps(
+    input_folder: str,
+    gap_chars: list[str] = ["-", "X", "?"],
+    filter: list[str] = ["start", "end", "center"],
+    append: bool = False,
+    jobs: Optional[int] = 1,
+) -> None:
+    run_parallel(
+        code_gaps,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        gap_chars=gap_chars,
+        filter=filter,
+        append=append,
+    )
 
 
 def apply_replace_ambiguous_chars(
-    input_folder: str, search_chars: list[str], replace_char: Optional[str] = "?"
+    input_folder: str,
+    search_chars: list[str],
+    replace_char: Optional[str] = "?",
+    jobs: Optional[int] = 1,
 ):
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            replace_ambiguous_chars(
-                os.path.join(root, filename), search_chars, replace_char
-            )
+    run_parallel(
+        replace_ambiguous_chars,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        search_chars=search_chars,
+        replace_char=replace_char,
+    )
 
 
 def replace_char_in_filenames(
-    input_folder: str, search_char: str, replace_char: Optional[str] = "_"
+    input_folder: str,
+    search_char: str,
+    replace_char: Optional[str] = "_",
+    jobs: Optional[int] = 1,
 ) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            replace_char_in_filename(
-                os.path.join(root, filename),
-                search_char=" ",
-                replacement_char=replace_char,
-            )
+    run_parallel(
+        replace_char_in_filename,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        search_char=" ",
+        replacement_char=replace_char,
+    )
+
+
+def create_typed_blast_db(in_file: str, blast_db_out: Optional[str] = None) -> None:
+    data_type = get_molecular_data_type(in_file)
+    create_blast_db(in_file, blast_db_out, data_type)
 
 
 def create_blast_dbs(
     input_folder: str,
     blast_db_out: Optional[str] = None,
+    jobs: Optional[int] = 1,
 ) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            try:
-                data_type = get_molecular_data_type(os.path.join(root, filename))
-                create_blast_db(os.path.join(root, filename), blast_db_out, data_type)
-            except:
-                pass
+    run_parallel(
+        create_typed_blast_db,
+        sorted(list_files(input_folder)),
+        jobs=jobs,
+        blast_db_out=blast_db_out,
+    )
+
+
+def get_blast_result_folder(
+    query_folder: str, ref_blast_db: str, dcmegablast: Optional[bool] = False
+) -> str:
+    ref_blast_db_tag = re.sub(r"/$", "", ref_blast_db).split("/")[-1]
+    if dcmegablast:
+        blast_result_prefix = "bioinformatics/output/blast_hits/dc-megablast/"
+    else:
+        blast_result_prefix = "bioinformatics/output/blast_hits/blastn/"
+    query_set_tag = re.sub(r"/$", "", query_folder).split("/")[-1]
+    return f"{blast_result_prefix}{query_set_tag}_VS_{ref_blast_db_tag}"
+
+
+def get_ref_blast_db_path(ref_blast_db: str) -> str:
+    ref_blast_db_tag = re.sub(r"/$", "", ref_blast_db).split("/")[-1]
+    return ref_blast_db + f"{ref_blast_db_tag}"
+
+
+def get_query_tag(filename: str) -> str:
+    return re.sub(rf"\.{suffix_parser(filename)}", "", filename)
+
+
+def blast_and_inject(
+    in_file: str,
+    ref_blast_db: str,
+    extraction_folder: str,
+    translated: Optional[bool] = False,
+    dcmegablast: Optional[bool] = False,
+    threads: Optional[int] = None,
+) -> None:
+    root, filename = os.path.split(in_file)
+    blast_result_out = (
+        get_blast_result_folder(root, ref_blast_db, dcmegablast)
+        + f"/{get_query_tag(filename)}"
+    )
+    single_fasta_blast(
+        query=in_file,
+        ref_db=get_ref_blast_db_path(ref_blast_db),
+        blast_result_out=blast_result_out,
+        translated=translated,
+        dcmegablast=dcmegablast,
+        threads=threads,
+    )
+    inject_blast_result(
+        input_file=os.path.join(extraction_folder, filename),
+        blast_hit_file=blast_result_out,
+    )
+
+
+def inject_blast_hit(files: tuple[str, str]) -> None:
+    input_file, blast_hit_file = files
+    inject_blast_result(input_file=input_file, blast_hit_file=blast_hit_file)
+
+
+def batch_blast_and_inject(
+    in_files: List[str],
+    ref_blast_db: str,
+    extraction_folder: str,
+    translated: Optional[bool] = False,
+    dcmegablast: Optional[bool] = False,
+    threads: Optional[int] = None,
+    jobs: Optional[int] = 1,
+) -> None:
+    # all loci of one query folder go through a single BLAST run
+    query_sets = {}
+    for in_file in in_files:
+        root, filename = os.path.split(in_file)
+        query_sets.setdefault(root, {})[get_query_tag(filename)] = in_file
+    for root, queries in query_sets.items():
+        blast_results = multi_fasta_blast(
+            queries=queries,
+            ref_db=get_ref_blast_db_path(ref_blast_db),
+            blast_result_out=get_blast_result_folder(root, ref_blast_db, dcmegablast),
+            translated=translated,
+            dcmegablast=dcmegablast,
+            threads=threads,
+        )
+        # a locus that fails to inject is reported without stopping the rest
+        run_parallel(
+            inject_blast_hit,
+            [
+                (
+                    os.path.join(extraction_folder, os.path.basename(query)),
+                    blast_results[query_tag],
+                )
+                for query_tag, query in queries.items()
+                if query_tag in blast_results
+            ],
+            jobs=jobs,
+        )
 
 
 def apply_single_fasta_blast(
@@ -145,34 +332,37 @@ def apply_single_fasta_blast(
     extraction_folder: str,
     translated: Optional[bool] = False,
     dcmegablast: Optional[bool] = False,
+    jobs: Optional[int] = 1,
+    batched: Optional[bool] = False,
 ) -> None:
-    ref_blast_db_tag = re.sub(r"/$", "", ref_blast_db).split("/")[-1]
-    ref_blast_db = ref_blast_db + f"{ref_blast_db_tag}"
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            if dcmegablast:
-                blast_result_prefix = "bioinformatics/output/blast_hits/dc-megablast/"
-            else:
-                blast_result_prefix = "bioinformatics/output/blast_hits/blastn/"
-            query_set_tag = re.sub(r"/$", "", root).split("/")[-1]
-            query_tag = re.sub(rf"\.{suffix_parser(filename)}", "", filename)
-            blast_result_out = f"{blast_result_prefix}{query_set_tag}_VS_{ref_blast_db_tag}/{query_tag}"
-            single_fasta_blast(
-                query=os.path.join(root, filename),
-                ref_db=ref_blast_db,
-                blast_result_out=blast_result_out,
-                translated=translated,
-                dcmegablast=dcmegablast,
-            )
-            inject_blast_result(
-                input_file=os.path.join(extraction_folder, filename),
-                blast_hit_file=blast_result_out,
-            )
+    in_files = sorted(list_files(input_folder))
+    if batched:
+        _, threads = split_core_budget(jobs, 1, tool_threads=True)
+        batch_blast_and_inject(
+            in_files,
+            ref_blast_db=ref_blast_db,
+            extraction_folder=extraction_folder,
+            translated=translated,
+            dcmegablast=dcmegablast,
+            threads=threads,
+            jobs=jobs,
+        )
+        return None
+    _, threads = split_core_budget(jobs, len(in_files), tool_threads=True)
+    run_parallel(
+        blast_and_inject,
+        in_files,
+        jobs=jobs,
+        ref_blast_db=ref_blast_db,
+        extraction_folder=extraction_folder,
+        translated=translated,
+        dcmegablast=dcmegablast,
+        threads=threads,
+    )
 
 
 def apply_fasta_clean_newlines(
     input_folder: str,
+    jobs: Optional[int] = 1,
 ) -> None:
-    for root, dirs, files in os.walk(input_folder):
-        for filename in tqdm(files):
-            fasta_clean_newlines(os.path.join(root, filename))
+    run_parallel(fasta_clean_newlines, sorted(list_files(input_folder)), jobs=jobs)
@@ -10,8 +10,23 @@ from bioinformatics.functions.file_utils import (
 from bioinformatics.models.trim import (
     TrimSoftware,
 )
+from bioinformatics.functions.cache import cached_call, cached_process
 
-from bioinformatics.functions.file_utils import generate_process
+
+def get_trimmed_file(
+    in_file: str, trimmer: TrimSoftware, method: Optional[str] = None
+) -> str:
+    if method is None:
+        out_file = inject_grandparent_directory(in_file, f"trimmed/{trimmer.name}")
+    else:
+        out_file = inject_grandparent_directory(
+            in_file, f"trimmed/{trimmer.name}/{method}"
+        )
+    if trimmer.name == "bmge":
+        out_file = replace_suffix(out_file, "nex")
+    elif trimmer.name == "clipkit":
+        out_file = replace_suffix(out_file, "fasta")
+    return out_file
 
 
 def trim_alignment(
@@ -19,15 +34,13 @@ def trim_alignment(
     trimmer: TrimSoftware,
     method: Optional[str] = None,
     stdout: bool = False,
-) -> None:  # (construct calls to the BMGE and/or trimal programs; trimal preferred)
+    cache: Optional[bool] = True,
+) -> str:  # (construct calls to the BMGE and/or trimal programs; trimal preferred)
     cmd = []
+    out_file = get_trimmed_file(in_file, trimmer, method)
     if method is None:
         method = "-automated1"
-        out_file = inject_grandparent_directory(in_file, f"trimmed/{trimmer.name}")
     else:
-        out_file = inject_grandparent_directory(
-            in_file, f"trimmed/{trimmer.name}/{method}"
-        )
         method = "-" + method
     create_parent_directory(out_file)
     if trimmer.name == "trimAl":
@@ -43,7 +56,6 @@ def trim_alignment(
         in_param = "-i"
         out_param = "-on"
         # out_file = inject_prefix_suffix(out_file, "", "_bmge")
-        out_file = replace_suffix(out_file, "nex")
         type_param = "-t"
         type = "CODON"
         cmd.extend(
@@ -52,10 +64,13 @@ def trim_alignment(
     elif trimmer.name != "clipkit":
         raise Exception("Trimming software choice not understood.")
     if trimmer.name != "clipkit":
-        generate_process(cmd, stdout)
+        cached_process(cmd, [in_file], [out_file], stdout=stdout, cache=cache)
     else:
-        out_file = replace_suffix(out_file, "fasta")
-        clipkit.execute(
+        cached_call(
+            clipkit.execute,
+            [in_file],
+            [out_file],
+            cache=cache,
             input_file=in_file,
             input_file_format=suffix_parser(in_file),
             mode=ClipkitMode("smart-gap"),
@@ -65,3 +80,4 @@ def trim_alignment(
             complement=False,
             use_log=False,
         )
+    return out_file
@@ -1,4 +1,11 @@
 from enum import Enum
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence, Union
+import numpy as np
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from bioinformatics.functions.fasta import iter_fasta_bytes
+from bioinformatics.functions.file_utils import suffix_parser
 
 
 class AlignmentSoftware(str, Enum):
@@ -15,3 +22,149 @@ class AlignmentOutputFormat(str, Enum):
     selex = "selex"
     st = "stockholm"
     vie = "vienna"
+
+
+class PhylipIndex(NamedTuple):
+    # byte offsets of every row of a sequential PHYLIP matrix: rows maps a taxon
+    # to the (start, end) range of its line, newline included
+    taxa_count: int
+    site_count: int
+    rows: dict[str, tuple[int, int]]
+
+
+class Alignment:
+    # a locus held as one contiguous uint8 matrix (rows = sequences) plus label
+    # arrays; rows shorter than the widest are filled with fill_char and their
+    # true lengths kept in lengths. SeqRecords are only built when writing
+    __slots__ = ("matrix", "ids", "descriptions", "lengths", "path")
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        ids: Sequence[str],
+        descriptions: Optional[Sequence[str]] = None,
+        lengths: Optional[np.ndarray] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        self.matrix = matrix
+        self.ids = np.asarray(ids, dtype=object)
+        if descriptions is None:
+            descriptions = ids
+        self.descriptions = np.asarray(descriptions, dtype=object)
+        if lengths is None:
+            lengths = np.full(matrix.shape[0], matrix.shape[1], dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.path = path
+
+    @classmethod
+    def from_sequences(
+        cls,
+        ids: Sequence[str],
+        seqs: Sequence[Union[str, bytes, memoryview]],
+        descriptions: Optional[Sequence[str]] = None,
+        path: Optional[str] = None,
+        fill_char: str = "-",
+    ) -> "Alignment":
+        seqs = [x.encode() if isinstance(x, str) else x for x in seqs]
+        lengths = np.array([len(x) for x in seqs], dtype=np.int64)
+        width = int(lengths.max()) if len(seqs) else 0
+        matrix = np.full((len(seqs), width), ord(fill_char), dtype=np.uint8)
+        for idx, seq in enumerate(seqs):
+            matrix[idx, : len(seq)] = np.frombuffer(seq, dtype=np.uint8)
+        return cls(matrix, ids, descriptions, lengths, path)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[SeqRecord],
+        path: Optional[str] = None,
+        fill_char: str = "-",
+    ) -> "Alignment":
+        ids, descriptions, seqs = [], [], []
+        for record in records:
+            ids.append(record.id)
+            descriptions.append(record.description)
+            seqs.append(bytes(record.seq))
+        return cls.from_sequences(ids, seqs, descriptions, path, fill_char)
+
+    @classmethod
+    def from_file(
+        cls,
+        in_file: str,
+        file_format: Optional[str] = None,
+        fill_char: str = "-",
+    ) -> "Alignment":
+        if not file_format:
+            file_format = suffix_parser(in_file)
+            if file_format == "phylip":
+                file_format = "phylip-relaxed"
+        if file_format == "fasta":
+            ids, descriptions, seqs = [], [], []
+            for record in iter_fasta_bytes(in_file):
+                ids.append(record.id)
+                descriptions.append(record.description)
+                seqs.append(record.seq)
+            return cls.from_sequences(ids, seqs, descriptions, in_file, fill_char)
+        return cls.from_records(SeqIO.parse(in_file, file_format), in_file, fill_char)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.matrix.shape[1]
+
+    def is_aligned(self) -> bool:
+        return bool(np.all(self.lengths == self.width))
+
+    def row(self, idx: int) -> np.ndarray:
+        return self.matrix[idx, : self.lengths[idx]]
+
+    def column(self, idx: int) -> np.ndarray:
+        return self.matrix[:, idx]
+
+    def sequence(self, idx: int) -> str:
+        return self.row(idx).tobytes().decode()
+
+    def molecule_type(self) -> str:
+        # needed by writers such as NEXUS that declare a datatype; every IUPAC
+        # nucleotide code plus X, * and gap/missing symbols counts as DNA
+        nucleotides = "ACGTUNRYSWKMBDHVX"
+        symbols = (nucleotides + nucleotides.lower() + "*-.?").encode()
+        if np.isin(self.matrix, np.frombuffer(symbols, np.uint8)).all():
+            return "DNA"
+        return "protein"
+
+    def records(self, molecule_type: Optional[str] = None) -> Iterator[SeqRecord]:
+        annotations = {"molecule_type": molecule_type} if molecule_type else None
+        for idx in range(len(self)):
+            yield SeqRecord(
+                Seq(self.sequence(idx)),
+                id=self.ids[idx],
+                description=self.descriptions[idx],
+                annotations=annotations,
+            )
+
+    def write(
+        self,
+        out_file: str,
+        file_format: Optional[str] = None,
+        molecule_type: Optional[str] = None,
+    ) -> None:
+        if not file_format:
+            file_format = suffix_parser(out_file)
+        if file_format == "phylip":
+            # plain phylip truncates labels to 10 characters
+            file_format = "phylip-relaxed"
+        if file_format == "nexus" and not molecule_type:
+            molecule_type = self.molecule_type()
+        SeqIO.write(self.records(molecule_type), out_file, file_format)
+
+    def copy(self) -> "Alignment":
+        return Alignment(
+            self.matrix.copy(),
+            self.ids.copy(),
+            self.descriptions.copy(),
+            self.lengths.copy(),
+            self.path,
+        )
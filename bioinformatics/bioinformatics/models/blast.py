@@ -0,0 +1,29 @@
+from enum import Enum
+from typing import NamedTuple, Optional
+
+
+class BlastOutputFormat(str, Enum):
+    xml = "5"
+    tabular = "6"
+    tabular_commented = "7"
+
+
+class BlastHit(NamedTuple):
+    query_id: str
+    subject_id: str
+    percent_identity: float
+    alignment_length: int
+    query_start: int
+    query_end: int
+    subject_start: int
+    subject_end: int
+    evalue: float
+    bitscore: float
+    query_length: Optional[int] = None
+    subject_sequence: str = ""
+
+    @property
+    def query_coverage(self) -> Optional[float]:
+        if not self.query_length:
+            return None
+        return (abs(self.query_end - self.query_start) + 1) / self.query_length
@@ -0,0 +1,24 @@
+import numpy as np
+from typing import NamedTuple, Optional
+
+
+class FastaRecord(NamedTuple):
+    # id is the first word of the header and description the whole header, as in
+    # Biopython; seq is None when only headers were read
+    id: str
+    description: str
+    seq: Optional[memoryview] = None
+
+
+class OccupancyIndex(NamedTuple):
+    # sparse taxon x locus table in coordinate form: entry i says taxon
+    # taxa[rows[i]] has a sequence of lengths[i] characters, residues[i] of them
+    # not gaps or missing data, in locus loci[cols[i]]. modified holds each
+    # locus file's mtime (ns) when it was scanned
+    taxa: np.ndarray
+    loci: np.ndarray
+    modified: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    lengths: np.ndarray
+    residues: np.ndarray
@@ -1,10 +1,21 @@
-from bioinformatics.functions.tasks import (
-    pad_alignments,
-    perform_alignments,
-    trim_alignments,
-    fix_dna_alignments,
-    apply_replace_ambiguous_chars,
+from functools import partial
+from bioinformatics.functions.pipeline import (
+    ChainStep,
+    Stage,
+    chain_stage,
+    run_pipeline,
 )
+from bioinformatics.functions.align import (
+    get_alignment_file,
+    get_padded_file,
+    pad_alignment,
+    perform_alignment,
+)
+from bioinformatics.functions.orf import fix_dna_alignment, get_orf1_file
+from bioinformatics.functions.trim import get_trimmed_file, trim_alignment
+from bioinformatics.functions.clean import replace_ambiguous_chars
+from bioinformatics.functions.gap import code_gaps, get_gap_coded_file
+from bioinformatics.functions.file_utils import inject_prefix_suffix
 from bioinformatics.models.alignment import (
     AlignmentOutputFormat,
     AlignmentSoftware,
@@ -12,33 +23,65 @@ from bioinformatics.models.alignment import (
 from bioinformatics.models.trim import (
     TrimSoftware,
 )
-from bioinformatics.functions.file_utils import list_files
 
 input_folder = "bioinformatics/input/fasta/LEP1/"
-padded_input_folder = input_folder + "padded/"
-orf_input_folder = "bioinformatics/output/alignments/muscle3/LEP1/padded/"
-trimming_input_folder = "bioinformatics/output/alignments/muscle3/LEP1/ORF1/"
-trimmed_output_folder = "bioinformatics/output/alignments/muscle3/LEP1/trimmed/bmge/"
-
-# step 0
-list_files(input_folder)
-# step 1
-pad_alignments(input_folder)
-# step 2
-perform_alignments(
-    padded_input_folder, AlignmentSoftware("muscle3"), AlignmentOutputFormat("fasta")
-)
-# step 3
-fix_dna_alignments(orf_input_folder)
-# step 4 (optional) - trim alignments
-trim_alignments(trimming_input_folder, TrimSoftware("trimal"))
-trim_alignments(trimming_input_folder, TrimSoftware("trimal"), method="gappyout")
-trim_alignments(trimming_input_folder, TrimSoftware("trimal"), method="strictplus")
-trim_alignments(trimming_input_folder, TrimSoftware("trimal"), method="strict")
-trim_alignments(
-    trimming_input_folder, TrimSoftware("bmge")
-)  # this is preferred because CODON is available, which preserves codon ORF
-trim_alignments(trimming_input_folder, TrimSoftware("clipkit"))
-# step 5 (optional) - clean up ambiguous chars
-apply_replace_ambiguous_chars(trimmed_output_folder, ["X"], "?")
-# step 6 (optional) - code gap chars
+aligner = AlignmentSoftware("muscle3")
+output_format = AlignmentOutputFormat("fasta")
+
+
+def trim_stage(trimmer: TrimSoftware, method=None) -> Stage:
+    name = f"trim_{trimmer.name}" + (f"_{method}" if method else "")
+    return Stage(
+        name,
+        trim_alignment,
+        partial(get_trimmed_file, trimmer=trimmer, method=method),
+        depends="orf",
+        kwargs={"trimmer": trimmer, "method": method},
+    )
+
+
+def get_cleaned_gap_coded_file(in_file: str) -> str:
+    return get_gap_coded_file(inject_prefix_suffix(in_file, injected_suffix="_fmt"))
+
+
+stages = [
+    # step 1
+    Stage("pad", pad_alignment, get_padded_file),
+    # step 2
+    Stage(
+        "align",
+        perform_alignment,
+        partial(get_alignment_file, aligner=aligner, output_format=output_format),
+        depends="pad",
+        kwargs={"aligner": aligner, "output_format": output_format},
+    ),
+    # step 3
+    Stage("orf", fix_dna_alignment, get_orf1_file, depends="align"),
+    # step 4 (optional) - trim alignments
+    trim_stage(TrimSoftware("trimal")),
+    trim_stage(TrimSoftware("trimal"), "gappyout"),
+    trim_stage(TrimSoftware("trimal"), "strictplus"),
+    trim_stage(TrimSoftware("trimal"), "strict"),
+    trim_stage(
+        TrimSoftware("bmge")
+    ),  # this is preferred because CODON is available, which preserves codon ORF
+    trim_stage(TrimSoftware("clipkit")),
+    # steps 5 and 6 (optional) - clean up ambiguous chars, then code gap chars;
+    # chained in memory with the cleaned alignment kept as a checkpoint
+    chain_stage(
+        "clean_and_code_gaps",
+        [
+            ChainStep(
+                replace_ambiguous_chars,
+                {"search_chars": ["X"], "replace_char": "?"},
+                checkpoint=True,
+            ),
+            ChainStep(code_gaps, {"gap_chars": ["-", "?"], "append": True}),
+        ],
+        get_cleaned_gap_coded_file,
+        depends="trim_bmge",
+    ),
+]
+
+if __name__ == "__main__":
+    run_pipeline(stages, input_folder, jobs=-1)
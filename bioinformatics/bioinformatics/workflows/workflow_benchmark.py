@@ -17,6 +17,8 @@ generate_benchmark_data(
     birth_rate_range=birth_rate_range,
     death_rate_range=death_rate_range,
     stdout=False,
+    seed=0,
+    jobs=-1,
 )
 benchmark_phylogeny(builder=PhyloSoftware("iqtree2"), use_partition=False, stdout=True)
 parse_log_files()
@@ -0,0 +1,11 @@
+from bioinformatics.functions.stage_benchmark import (
+    run_stage_benchmarks,
+    compare_stage_benchmarks,
+)
+
+ntaxa_grid = [10, 100, 500]
+nsites_grid = [1000, 10000, 100000]
+
+if __name__ == "__main__":
+    results = run_stage_benchmarks(ntaxa_grid, nsites_grid, repeat=3)
+    compare_stage_benchmarks(results)
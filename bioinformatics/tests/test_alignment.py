@@ -0,0 +1,18 @@
+from bioinformatics.models.alignment import Alignment
+
+
+def get_nexus_format_line(out_file):
+    with open(out_file) as f:
+        return next(x for x in f if x.strip().startswith("format"))
+
+
+def test_nexus_datatype_of_dna_with_ambiguity_codes(tmp_path):
+    aln = Alignment.from_sequences(["a", "b"], ["ACGXNK-?", "ACG*TTBD"])
+    aln.write(str(tmp_path / "aln.nex"))
+    assert "datatype=dna" in get_nexus_format_line(tmp_path / "aln.nex")
+
+
+def test_nexus_datatype_of_protein(tmp_path):
+    aln = Alignment.from_sequences(["a", "b"], ["MKLV", "MKLE"])
+    aln.write(str(tmp_path / "aln.nex"))
+    assert "datatype=protein" in get_nexus_format_line(tmp_path / "aln.nex")
@@ -0,0 +1,45 @@
+from Bio.Seq import Seq
+from bioinformatics.functions.augment import (
+    backtranslate,
+    create_aa_alignment,
+    create_nt12_all_alignment,
+    create_nt12_degen_alignment,
+)
+from bioinformatics.models.alignment import Alignment
+
+
+def make_alignment(*seqs):
+    ids = [f"t{i}" for i in range(len(seqs))]
+    return Alignment.from_sequences(ids, seqs, path="loci/ORF1/L1.fasta")
+
+
+def test_create_aa_alignment_resolves_ambiguous_codons():
+    seq = "ATGGCYMGRRAYTAR---NNN"
+    aln = create_aa_alignment(make_alignment(seq), write=False)
+    assert aln.sequence(0) == "MARB*-X"
+    assert aln.sequence(0).replace("-", "") == str(
+        Seq(seq.replace("---", "")).translate()
+    )
+    assert aln.path == "loci/ORF1/aa/L1.fasta"
+
+
+def test_create_nt12_all_alignment():
+    aln = create_nt12_all_alignment(
+        make_alignment("ATGCCA---", "ATGCC-GGG"), write=False
+    )
+    assert [aln.sequence(0), aln.sequence(1)] == ["ATCC--", "ATCCGG"]
+
+
+def test_create_nt12_degen_alignment():
+    # Leu and Arg collapse across their first position, Ser stays split,
+    # stop codons and codons with gaps are left as they are
+    aln = create_nt12_degen_alignment(
+        make_alignment("TTACTGAGACGTTCAAGCTGATGGA-G"), write=False
+    )
+    assert aln.sequence(0) == "YTYTMGMGTCAGTGTGA-"
+
+
+def test_backtranslate():
+    aln = backtranslate(make_alignment("MLS-"), write=False)
+    assert aln.sequence(0) == "ATGYTNWSN---"
+    assert aln.lengths[0] == 12
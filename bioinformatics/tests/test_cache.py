@@ -0,0 +1,124 @@
+import os
+import subprocess
+import pytest
+import bioinformatics.functions.cache as cache
+import bioinformatics.functions.file_utils as file_utils
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache, "cache_enabled", True)
+    monkeypatch.setattr(file_utils, "run_log_enabled", False)
+    return tmp_path / "cache"
+
+
+def cache_entries(cache_dir):
+    if not cache_dir.exists():
+        return []
+    return [x for x in os.listdir(cache_dir) if not x.startswith(".")]
+
+
+def write_file(path, text, age=0):
+    path.write_text(text)
+    if age:
+        stamp = os.path.getmtime(path) - age
+        os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+def test_cached_process_hit(tmp_path, cache_dir, monkeypatch):
+    in_file = write_file(tmp_path / "in.txt", "ACGT")
+    out_file = str(tmp_path / "out.txt")
+    cache.cached_process(["cp", in_file, out_file], [in_file], [out_file])
+    assert len(cache_entries(cache_dir)) == 1
+    os.remove(out_file)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("tool ran on a cache hit")
+
+    monkeypatch.setattr(cache, "generate_process", fail)
+    cache.cached_process(["cp", in_file, out_file], [in_file], [out_file])
+    assert open(out_file).read() == "ACGT"
+
+
+def test_cached_process_miss_on_changed_input(tmp_path, cache_dir):
+    in_file = write_file(tmp_path / "in.txt", "ACGT")
+    out_file = str(tmp_path / "out.txt")
+    cache.cached_process(["cp", in_file, out_file], [in_file], [out_file])
+    write_file(tmp_path / "in.txt", "TTTT")
+    cache.cached_process(["cp", in_file, out_file], [in_file], [out_file])
+    assert open(out_file).read() == "TTTT"
+    assert len(cache_entries(cache_dir)) == 2
+
+
+def test_cached_process_failure_is_not_stored(tmp_path, cache_dir):
+    in_file = write_file(tmp_path / "in.txt", "ACGT")
+    out_file = write_file(tmp_path / "out.txt", "stale", age=3600)
+    with pytest.raises(subprocess.CalledProcessError):
+        cache.cached_process(
+            ["sh", "-c", "exit 1", in_file, out_file], [in_file], [out_file]
+        )
+    assert cache_entries(cache_dir) == []
+
+
+def test_cached_process_ignores_stale_outputs(tmp_path, cache_dir):
+    # the tool succeeds but does not write out_file: the old file is not stored
+    in_file = write_file(tmp_path / "in.txt", "ACGT")
+    out_file = write_file(tmp_path / "out.txt", "stale", age=3600)
+    cache.cached_process(["true", in_file, out_file], [in_file], [out_file])
+    assert cache_entries(cache_dir) == []
+
+
+def test_cached_call_failure_is_not_stored(tmp_path, cache_dir):
+    in_file = write_file(tmp_path / "in.txt", "ACGT")
+    out_file = str(tmp_path / "out.txt")
+
+    def fail(in_file, out_file):
+        with open(out_file, "w") as f:
+            f.write("partial")
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        cache.cached_call(fail, [in_file], [out_file], in_file, out_file)
+    assert cache_entries(cache_dir) == []
+
+
+def test_evict_cache_removes_least_recently_used(tmp_path, cache_dir):
+    for key in ["old", "new"]:
+        out_file = write_file(tmp_path / f"{key}.txt", "A" * 100)
+        cache.store_cached(key, [out_file])
+    stamp = os.path.getmtime(cache_dir / "new") - 60
+    os.utime(cache_dir / "old", (stamp, stamp))
+    cache.evict_cache(size_limit=150)
+    assert cache_entries(cache_dir) == ["new"]
+
+
+def test_cache_key_ignores_resource_flags(tmp_path):
+    in_file = write_file(tmp_path / "in.phy", "2 4\nt0 ACGT\nt1 ACGA\n")
+    iqtree = str(tmp_path / "iqtree2_v2.2.0")
+    write_file(tmp_path / "iqtree2_v2.2.0", "binary")
+    key = cache.cache_key(
+        [iqtree, "-s", in_file, "-T", "4", "-mem", "512M", "-m", "MFP"], [in_file]
+    )
+    assert key == cache.cache_key(
+        [iqtree, "-s", in_file, "-T", "16", "-mem", "2048M", "-m", "MFP"], [in_file]
+    )
+    assert key == cache.cache_key([iqtree, "-s", in_file, "-m", "MFP"], [in_file])
+    assert key != cache.cache_key([iqtree, "-s", in_file, "-m", "GTR"], [in_file])
+
+
+def test_cached_process_hit_with_different_threads(tmp_path, cache_dir, monkeypatch):
+    # a rerun with another --threads value restores the stored output
+    in_file = write_file(tmp_path / "in.txt", "ACGT")
+    out_file = str(tmp_path / "out.txt")
+    cmd = ["sh", "-c", 'cp "$1" "$2"', "sh", in_file, out_file]
+    cache.cached_process(cmd + ["--threads", "2"], [in_file], [out_file])
+    os.remove(out_file)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("tool ran on a cache hit")
+
+    monkeypatch.setattr(cache, "generate_process", fail)
+    cache.cached_process(cmd + ["--threads", "8"], [in_file], [out_file])
+    assert open(out_file).read() == "ACGT"
@@ -0,0 +1,12 @@
+from Bio import SeqIO
+
+from bioinformatics.functions.consensus import generate_consensus
+
+
+def test_generate_consensus_threshold_ids_are_unique(tmp_path):
+    in_file = tmp_path / "input/fasta/L1.fasta"
+    in_file.parent.mkdir(parents=True)
+    in_file.write_text(">t0\nACGT\n>t1\nACGA\n>t2\nACTA\n")
+    output_file = generate_consensus(str(in_file), thresholds=[0.5, 0.75])
+    records = list(SeqIO.parse(output_file, "fasta"))
+    assert [x.id for x in records] == ["L1_50.0%_consensus", "L1_75.0%_consensus"]
@@ -0,0 +1,40 @@
+from bioinformatics.functions.gap import code_gaps, find_unique_gaps, score_gaps
+from bioinformatics.models.alignment import Alignment
+
+# row 1's gap is nested inside row 0's, row 2's overlaps the end of row 0's
+seqs = ["AC----GTAC", "ACG--TGTAC", "ACGT---TAC", "ACGTACGTAC"]
+
+
+def make_alignment(seqs):
+    ids = [f"t{i}" for i in range(len(seqs))]
+    return Alignment.from_sequences(ids, seqs, path="loci/L1.fasta")
+
+
+def test_find_unique_gaps():
+    assert find_unique_gaps(make_alignment(seqs)) == [(2, 6), (3, 5), (4, 7)]
+
+
+def test_find_unique_gaps_filter():
+    # a trailing run of up to three gap chars is a partial codon, not a gap
+    aln = make_alignment(["--GTACGT----", "ACGT-CGTAC--"])
+    assert find_unique_gaps(aln, filter=["center"]) == [(4, 5)]
+    assert find_unique_gaps(aln, filter=["start", "end"]) == [(0, 2), (8, 12)]
+
+
+def test_score_gaps_simple_indel_coding():
+    # 1 where a row has exactly the gap, ? where the gap lies inside a larger
+    # gap of that row, 0 otherwise (including partial overlap)
+    scores = score_gaps(make_alignment(seqs))
+    assert [scores.sequence(i) for i in range(len(seqs))] == [
+        "1?0",
+        "010",
+        "001",
+        "000",
+    ]
+
+
+def test_code_gaps_append():
+    coded = code_gaps(make_alignment(seqs), append=True, write=False)
+    assert coded.sequence(0) == "AC----GTAC1?0"
+    assert coded.path == "loci/gap_coded/L1.fasta"
+    assert list(coded.lengths) == [13] * 4
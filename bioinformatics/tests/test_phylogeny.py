@@ -0,0 +1,46 @@
+import threading
+
+from bioinformatics.functions import parallel
+from bioinformatics.functions.phylogeny import estimate_phylogeny_resources
+
+# benchmark grid runs: 50 MB fixed overhead plus 1e-5 MB per taxa x sites cell,
+# so the smallest run has by far the highest MB-per-cell ratio
+history = [
+    (t, s, round(50 + 1e-5 * t * s))
+    for t in [10, 50, 100]
+    for s in [1_000, 10_000, 100_000]
+]
+
+
+def write_phylip_header(path, ntaxa, nsites):
+    path.write_text(f"{ntaxa} {nsites}\n")
+    return str(path)
+
+
+def test_estimate_is_not_scaled_from_small_run_overhead(tmp_path):
+    alignment = write_phylip_header(tmp_path / "large.phy", 200, 400_000)
+    _, memory_mb = estimate_phylogeny_resources(alignment, history)
+    # 50 + 800 MB with a 1.25 margin, not 8e7 cells x the 10 x 1000 run's ratio
+    assert 1_000 <= memory_mb <= 1_100
+
+
+def test_large_jobs_share_a_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel, "available_cores", lambda: 4)
+    alignments = [
+        write_phylip_header(tmp_path / f"large_{i}.phy", 200, 400_000) for i in range(2)
+    ]
+    demands = [
+        estimate_phylogeny_resources(x, history, max_threads=2) for x in alignments
+    ]
+    # both runs have to be in flight together to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run(alignment, threads, memory_mb):
+        barrier.wait()
+        return memory_mb
+
+    results, errors = parallel.run_budgeted(
+        run, alignments, demands, cores=4, memory_mb=4_000
+    )
+    assert not errors
+    assert results == [x[1] for x in demands]
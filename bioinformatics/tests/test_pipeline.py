@@ -0,0 +1,120 @@
+import os
+import pytest
+import bioinformatics.functions.file_utils as file_utils
+from bioinformatics.functions.align import get_padded_file, pad_alignment
+from bioinformatics.functions.augment import (
+    backtranslate,
+    create_aa_alignment,
+    create_nt12_all_alignment,
+    create_nt12_degen_alignment,
+    filter_by_completeness,
+    remove_site_by_taxon_completeness,
+    remove_taxon_by_site_completeness,
+)
+from bioinformatics.functions.clean import replace_ambiguous_chars
+from bioinformatics.functions.file_utils import inject_prefix_suffix
+from bioinformatics.functions.gap import code_gaps, get_gap_coded_file
+from bioinformatics.functions.orf import fix_dna_alignment
+from bioinformatics.models.alignment import Alignment
+from bioinformatics.functions.pipeline import (
+    ChainStep,
+    Stage,
+    chain_stage,
+    run_chain,
+    run_pipeline,
+    stage_signature,
+)
+
+
+def get_copy_file(in_file):
+    return in_file.replace("/loci/", "/copied/")
+
+
+def copy_locus(in_file):
+    # fails, leaving a truncated output, while a "fail" marker sits next to loci/
+    out_file = get_copy_file(in_file)
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    marker = os.path.join(os.path.dirname(os.path.dirname(in_file)), "fail")
+    with open(in_file) as f_in, open(out_file, "w") as f_out:
+        data = f_in.read()
+        if os.path.exists(marker):
+            f_out.write(data[:1])
+            raise RuntimeError("tool failed")
+        f_out.write(data)
+
+
+def test_failed_stage_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "run_log_enabled", False)
+    (tmp_path / "loci").mkdir()
+    locus = tmp_path / "loci" / "L1.fasta"
+    out_file = tmp_path / "copied" / "L1.fasta"
+    state_file = str(tmp_path / "state.json")
+    stages = [Stage("copy", copy_locus, get_copy_file)]
+    locus.write_text(">a\nACGT\n")
+    assert not run_pipeline(stages, str(tmp_path / "loci"), state_file=state_file)
+    # an edited locus whose run fails, then the edit is reverted: the truncated
+    # output matches no recorded signature and is rebuilt
+    locus.write_text(">a\nTTTT\n")
+    (tmp_path / "fail").write_text("")
+    assert run_pipeline(stages, str(tmp_path / "loci"), state_file=state_file)
+    assert out_file.read_text() == ">"
+    os.remove(tmp_path / "fail")
+    locus.write_text(">a\nACGT\n")
+    assert not run_pipeline(stages, str(tmp_path / "loci"), state_file=state_file)
+    assert out_file.read_text() == ">a\nACGT\n"
+
+
+def test_run_chain_writes_checkpoint_and_final_file(tmp_path):
+    (tmp_path / "loci").mkdir()
+    locus = tmp_path / "loci" / "L1.fasta"
+    locus.write_text(">a\nACX---GTAC\n>b\nACGTACGTAC\n")
+    steps = [
+        ChainStep(pad_alignment),
+        ChainStep(
+            replace_ambiguous_chars,
+            {"search_chars": ["X"], "replace_char": "?"},
+            checkpoint=True,
+        ),
+        ChainStep(code_gaps, {"gap_chars": ["-"], "append": True}),
+    ]
+    out_file = run_chain(str(locus), steps)
+    checkpoint = inject_prefix_suffix(get_padded_file(str(locus)), "", "_fmt")
+    assert out_file == get_gap_coded_file(checkpoint)
+    # the padded alignment only ever existed in memory
+    assert not os.path.exists(get_padded_file(str(locus)))
+    assert open(checkpoint).read() == ">a\nAC?---GTAC\n>b\nACGTACGTAC\n"
+    assert open(out_file).read() == ">a\nAC?---GTAC1\n>b\nACGTACGTAC0\n"
+
+
+def test_chain_stage_signature_is_stable():
+    steps = [ChainStep(code_gaps, {"append": True})]
+    stage = chain_stage("gaps", steps, get_gap_coded_file)
+    assert stage.func is run_chain
+    assert "0x" not in repr(stage.kwargs)
+    assert stage_signature(stage, []) == stage_signature(
+        chain_stage("gaps", list(steps), get_gap_coded_file), []
+    )
+
+
+@pytest.mark.parametrize(
+    "step",
+    [
+        pad_alignment,
+        code_gaps,
+        lambda aln, write: replace_ambiguous_chars(aln, ["N"], write=write),
+        lambda aln, write: fix_dna_alignment(aln, best_orf=1, write=write),
+        create_aa_alignment,
+        create_nt12_all_alignment,
+        create_nt12_degen_alignment,
+        backtranslate,
+        lambda aln, write: remove_taxon_by_site_completeness(aln, 0.5, write=write),
+        lambda aln, write: remove_site_by_taxon_completeness(aln, 0.5, write=write),
+        lambda aln, write: filter_by_completeness(aln, 0.5, 0.5, write=write),
+    ],
+)
+def test_in_memory_step_without_path(step):
+    # an alignment built in memory has no source file to derive an output from
+    aln = Alignment.from_sequences(["t0", "t1"], ["ATGGC--TA", "ATGNCAGTA"])
+    result = step(aln, write=False)
+    assert isinstance(result, Alignment)
+    assert result.path is None
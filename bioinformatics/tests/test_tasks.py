@@ -0,0 +1,20 @@
+import bioinformatics.functions.tasks as tasks
+
+
+def test_batch_blast_and_inject_reports_failed_locus(tmp_path, monkeypatch, capsys):
+    in_files = [str(tmp_path / f"queries/L{i}.fasta") for i in range(3)]
+    injected = []
+
+    def multi_fasta_blast(queries, blast_result_out, **kwargs):
+        return {x: f"{blast_result_out}/{x}" for x in queries}
+
+    def inject_blast_result(input_file, blast_hit_file):
+        if input_file.endswith("L1.fasta"):
+            raise ValueError("malformed hit")
+        injected.append(input_file)
+
+    monkeypatch.setattr(tasks, "multi_fasta_blast", multi_fasta_blast)
+    monkeypatch.setattr(tasks, "inject_blast_result", inject_blast_result)
+    tasks.batch_blast_and_inject(in_files, "blastdb/ref/", str(tmp_path / "out"))
+    assert injected == [str(tmp_path / f"out/L{i}.fasta") for i in [0, 2]]
+    assert "1 item(s) failed" in capsys.readouterr().out